@@ -1,8 +1,37 @@
 
 import argparse
+import glob
 import json
+import os
+import re
+import subprocess
+import tempfile
+import time
 import yaml
 import sys
+from concurrent.futures import ProcessPoolExecutor
+
+# libyaml（C で書かれた速い実装）が入っていればそちらを使い、なければふつうの Python 版を使う
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+    LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+    LIBYAML = False
+
+# ストリーミング変換で一度に読む文字数
+STREAM_CHUNK = 64 * 1024
+
+# JSON の字句（前の空白もふくむ）。文字列は "…" 全体、数値は JSON の書き方どおり
+JSON_TOKEN_RE = re.compile(r'''
+    [ \t\r\n]*
+    (?:
+        (?P<punct>[{}\[\],:])
+      | (?P<string>"[^"\\]*(?:\\.[^"\\]*)*")
+      | (?P<number>-?(?:0|[1-9][0-9]*)(?P<frac>(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?))
+      | (?P<word>true|false|null)
+    )''', re.VERBOSE)
+JSON_WORDS = {'true': True, 'false': False, 'null': None}
 
 
 def to_yaml(input_path, output_path):
@@ -20,7 +49,7 @@ def to_yaml(input_path, output_path):
     try:
         with open(output_path, 'w', encoding='utf-8') as f:
             # allow_unicode=True で日本語文字も問題なく書き出せます
-            yaml.dump(data, f, allow_unicode=True, sort_keys=False)
+            yaml.dump(data, f, Dumper=SafeDumper, allow_unicode=True, sort_keys=False)
     except Exception as e:
         print(f"エラー: YAMLの書き出しに失敗しました: {e}", file=sys.stderr)
         sys.exit(1)
@@ -30,7 +59,7 @@ def to_json(input_path, output_path):
     """YAMLファイルを読み込んでJSONファイルを書き出す"""
     try:
         with open(input_path, 'r', encoding='utf-8') as f:
-            data = yaml.safe_load(f)
+            data = yaml.load(f, Loader=SafeLoader)
     except FileNotFoundError:
         print(f"エラー: ファイルが見つかりません: {input_path}", file=sys.stderr)
         sys.exit(1)
@@ -47,6 +76,438 @@ def to_json(input_path, output_path):
         sys.exit(1)
 
 
+def iter_json_tokens(f):
+    """
+    JSON を STREAM_CHUNK ずつ読みながら (種類, 値, 位置) を返す。
+    バッファには読みかけの字句1つぶんしか残さないので、ファイル全体は読みこまない。
+    """
+    buf = ''
+    pos = 0      # buf の中の読んだ位置
+    offset = 0   # buf の先頭がファイルの何文字目か（エラー表示用）
+    eof = False
+    while True:
+        m = JSON_TOKEN_RE.match(buf, pos)
+        # 字句がバッファの終わりで切れているかもしれないときは、続きを読んでからやり直す
+        # （"1e+300" が "1e" で切れていると "1" だけに合ってしまうので、後ろに数文字の余裕を見る）
+        if not eof and (m is None or m.end() + 3 > len(buf)):
+            more = f.read(max(STREAM_CHUNK, len(buf) - pos))
+            buf = buf[pos:] + more
+            offset += pos
+            pos = 0
+            eof = not more
+            continue
+        if m is None:
+            if buf[pos:].strip(' \t\r\n'):
+                raise ValueError(f'JSONとして読めない文字があります（{offset + pos} 文字目付近）')
+            return
+        kind = m.lastgroup
+        text = m.group(kind)
+        if kind == 'string':
+            value = json.loads(text) if '\\' in text else text[1:-1]
+        elif kind == 'number':
+            value = float(text) if m.group('frac') else int(text)
+        elif kind == 'word':
+            value = JSON_WORDS[text]
+        else:
+            value = text
+        yield kind, value, offset + m.start(kind)
+        pos = m.end()
+
+
+def iter_json_events(f):
+    """
+    JSON をイベント列 (種類, 値) にする。種類は start_map / end_map / start_list / end_list / key / value。
+    覚えておくのは入れ子の深さぶんのスタックだけ。
+    """
+    stack = []
+    state = 'value'  # value / value_or_end / key / key_or_end / colon / after_value / done
+
+    def finished():
+        return 'after_value' if stack else 'done'
+
+    for kind, value, where in iter_json_tokens(f):
+        punct = value if kind == 'punct' else None
+        if state in ('value', 'value_or_end'):
+            if punct == ']' and state == 'value_or_end':
+                stack.pop()
+                yield 'end_list', None
+                state = finished()
+            elif punct == '{':
+                stack.append('{')
+                yield 'start_map', None
+                state = 'key_or_end'
+            elif punct == '[':
+                stack.append('[')
+                yield 'start_list', None
+                state = 'value_or_end'
+            elif punct is None:
+                yield 'value', value
+                state = finished()
+            else:
+                raise ValueError(f"'{punct}' の位置がおかしいです（{where} 文字目）")
+        elif state in ('key', 'key_or_end'):
+            if punct == '}' and state == 'key_or_end':
+                stack.pop()
+                yield 'end_map', None
+                state = finished()
+            elif kind == 'string':
+                yield 'key', value
+                state = 'colon'
+            else:
+                raise ValueError(f'キー（文字列）が必要です（{where} 文字目）')
+        elif state == 'colon':
+            if punct != ':':
+                raise ValueError(f"':' が必要です（{where} 文字目）")
+            state = 'value'
+        elif state == 'after_value':
+            if punct == ',':
+                state = 'key' if stack[-1] == '{' else 'value'
+            elif punct == '}' and stack[-1] == '{':
+                stack.pop()
+                yield 'end_map', None
+                state = finished()
+            elif punct == ']' and stack[-1] == '[':
+                stack.pop()
+                yield 'end_list', None
+                state = finished()
+            else:
+                raise ValueError(f"',' か閉じかっこが必要です（{where} 文字目）")
+        else:
+            raise ValueError(f'JSONの後ろに余分なデータがあります（{where} 文字目）')
+    if state != 'done':
+        raise ValueError('JSONが途中で終わっています')
+
+
+def json_events_to_yaml(events):
+    """JSON のイベント列を PyYAML のイベント列にする（スカラーの書き方は yaml.dump と同じになる）"""
+    representer = yaml.representer.SafeRepresenter()
+    resolver = yaml.resolver.Resolver()
+    yield yaml.StreamStartEvent()
+    yield yaml.DocumentStartEvent(explicit=False)
+    for kind, value in events:
+        if kind == 'start_map':
+            yield yaml.MappingStartEvent(None, None, True, flow_style=False)
+        elif kind == 'end_map':
+            yield yaml.MappingEndEvent()
+        elif kind == 'start_list':
+            yield yaml.SequenceStartEvent(None, None, True, flow_style=False)
+        elif kind == 'end_list':
+            yield yaml.SequenceEndEvent()
+        else:
+            # yaml.dump の Serializer と同じように、タグを省略できるか（"true" や "123" という文字列は引用符つき）を決める
+            node = representer.represent_data(value)
+            detected = resolver.resolve(yaml.ScalarNode, node.value, (True, False))
+            default = resolver.resolve(yaml.ScalarNode, node.value, (False, True))
+            yield yaml.ScalarEvent(None, node.tag, (node.tag == detected, node.tag == default),
+                                   node.value, style=node.style)
+    yield yaml.DocumentEndEvent(explicit=False)
+    yield yaml.StreamEndEvent()
+
+
+def yaml_scalar_value(event, resolver, constructor):
+    """YAML のスカラーイベントを safe_load と同じ Python の値にする"""
+    tag = event.tag
+    if tag is None or tag == '!':
+        tag = resolver.resolve(yaml.ScalarNode, event.value, event.implicit)
+    build = constructor.yaml_constructors.get(tag)
+    if build is None or tag == 'tag:yaml.org,2002:merge':
+        raise ValueError(f'ストリーミングでは使えないタグです: {tag}')
+    return build(constructor, yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, event.style))
+
+
+def json_key(value):
+    """json.dump と同じように、文字列以外のキーを文字列にする"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool) or value is None or isinstance(value, (int, float)):
+        return json.dumps(value)
+    raise ValueError(f'JSONのキーにできない値です: {value!r}')
+
+
+def write_yaml_events_as_json(events, out):
+    """
+    YAML のイベント列を json.dump(ensure_ascii=False, indent=2) と同じ形の JSON として書き出す。
+    アンカーはスカラーのものだけ覚えておき、配列やマッピングへの参照（エイリアス）はエラーにする。
+    """
+    resolver = yaml.resolver.Resolver()
+    constructor = yaml.constructor.SafeConstructor()
+    anchors = {}
+    stack = []  # 入れ子ごとに [マッピングか, 書いた要素の数, 次は値か]
+    documents = 0
+
+    def put(text, is_key=False):
+        if stack:
+            top = stack[-1]
+            if top[0] and top[2]:
+                out.write(': ')
+                top[2] = False
+            else:
+                out.write(',\n' if top[1] else '\n')
+                out.write('  ' * len(stack))
+                top[1] += 1
+                top[2] = is_key
+        out.write(text)
+
+    def is_key_position():
+        return bool(stack) and stack[-1][0] and not stack[-1][2]
+
+    for event in events:
+        if isinstance(event, yaml.DocumentStartEvent):
+            documents += 1
+            if documents > 1:
+                raise ValueError('YAMLに複数のドキュメントがあります')
+        elif isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+            if is_key_position():
+                raise ValueError('配列やマッピングをキーにしたYAMLはJSONにできません')
+            if event.anchor:
+                anchors[event.anchor] = None  # 参照されたらエラーにする
+            is_map = isinstance(event, yaml.MappingStartEvent)
+            put('{' if is_map else '[')
+            stack.append([is_map, 0, False])
+        elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+            is_map, count, _ = stack.pop()
+            if count:
+                out.write('\n' + '  ' * len(stack))
+            out.write('}' if is_map else ']')
+        elif isinstance(event, (yaml.ScalarEvent, yaml.AliasEvent)):
+            if isinstance(event, yaml.AliasEvent):
+                if anchors.get(event.anchor, ()) is None:
+                    raise ValueError(f'配列やマッピングへのエイリアス *{event.anchor} はストリーミングでは使えません')
+                if event.anchor not in anchors:
+                    raise ValueError(f'定義されていないエイリアスです: *{event.anchor}')
+                value = anchors[event.anchor][0]
+            else:
+                value = yaml_scalar_value(event, resolver, constructor)
+                if event.anchor:
+                    anchors[event.anchor] = (value,)
+            if is_key_position():
+                put(json.dumps(json_key(value), ensure_ascii=False), is_key=True)
+            else:
+                try:
+                    put(json.dumps(value, ensure_ascii=False))
+                except TypeError:
+                    raise ValueError(f'JSONにできない値です: {value!r}') from None
+    if not documents:
+        out.write('null')
+
+
+def remove_tmp(tmp_path):
+    """書きかけの .tmp を消す（置きかえたあとや、作る前に失敗したときは何もしない）"""
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+
+def to_yaml_stream(input_path, output_path):
+    """
+    JSONファイルを少しずつ読みながらYAMLを書き出す（メモリは入れ子の深さぶんしか使わない）。
+    読みながら書くので、いったん .tmp に書き、最後まで読めたら置きかえる。
+    """
+    tmp_path = output_path + '.tmp'
+    try:
+        with open(input_path, 'r', encoding='utf-8') as src, \
+                open(tmp_path, 'w', encoding='utf-8') as dst:
+            yaml.emit(json_events_to_yaml(iter_json_events(src)), dst, Dumper=SafeDumper, allow_unicode=True)
+        os.replace(tmp_path, output_path)
+    except FileNotFoundError:
+        print(f"エラー: ファイルが見つかりません: {input_path}", file=sys.stderr)
+        sys.exit(1)
+    except ValueError as e:
+        print(f"エラー: JSONの読み込みに失敗しました: {e}", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"エラー: YAMLの書き出しに失敗しました: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        remove_tmp(tmp_path)
+
+
+def to_json_stream(input_path, output_path):
+    """YAMLファイルをイベントごとに読みながらJSONを書き出す（to_yaml_stream と同じく .tmp から置きかえる）"""
+    tmp_path = output_path + '.tmp'
+    try:
+        with open(input_path, 'r', encoding='utf-8') as src, \
+                open(tmp_path, 'w', encoding='utf-8') as dst:
+            write_yaml_events_as_json(yaml.parse(src, Loader=SafeLoader), dst)
+        os.replace(tmp_path, output_path)
+    except FileNotFoundError:
+        print(f"エラー: ファイルが見つかりません: {input_path}", file=sys.stderr)
+        sys.exit(1)
+    except (yaml.YAMLError, ValueError) as e:
+        print(f"エラー: YAMLの読み込みに失敗しました: {e}", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"エラー: JSONの書き出しに失敗しました: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        remove_tmp(tmp_path)
+
+
+INPUT_EXTS = {'to_yaml': ('.json',), 'to_json': ('.yaml', '.yml')}
+OUTPUT_EXT = {'to_yaml': '.yaml', 'to_json': '.json'}
+
+
+def convert_file(task):
+    """
+    batch 用に1ファイルを変換する（ワーカープロセスで動く）。
+    いったん .tmp に書いてから置きかえるので、失敗しても中途半端な出力は残らない。
+    戻り値はエラーの文章（成功したら None）。
+    """
+    command, input_path, output_path, stream = task
+    tmp_path = output_path + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        with open(input_path, 'r', encoding='utf-8') as src, open(tmp_path, 'w', encoding='utf-8') as dst:
+            if command == 'to_yaml' and stream:
+                yaml.emit(json_events_to_yaml(iter_json_events(src)), dst, Dumper=SafeDumper, allow_unicode=True)
+            elif command == 'to_yaml':
+                yaml.dump(json.load(src), dst, Dumper=SafeDumper, allow_unicode=True, sort_keys=False)
+            elif stream:
+                write_yaml_events_as_json(yaml.parse(src, Loader=SafeLoader), dst)
+            else:
+                json.dump(yaml.load(src, Loader=SafeLoader), dst, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, output_path)
+        return None
+    except Exception as e:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return f'{type(e).__name__}: {e}'
+
+
+def collect_batch_inputs(command, targets, out_dir):
+    """
+    フォルダ（中を全部さがす）・グロブ・ファイル名から (入力, 出力) の組を集める。
+    out_dir がなければ入力の隣に、あればフォルダの中の並びをそのまま out_dir に作る。
+    """
+    pairs = {}
+    for target in targets:
+        if os.path.isdir(target):
+            root = target
+            paths = []
+            for dirpath, _, names in os.walk(target):
+                paths.extend(os.path.join(dirpath, n) for n in names
+                             if n.lower().endswith(INPUT_EXTS[command]))
+        elif any(ch in target for ch in '*?['):
+            root = None
+            paths = [p for p in glob.glob(target, recursive=True) if os.path.isfile(p)]
+        else:
+            root = None
+            paths = [target]
+        for path in sorted(paths):
+            rel = os.path.relpath(path, root) if root else os.path.basename(path)
+            base = os.path.splitext(os.path.join(out_dir, rel) if out_dir else path)[0]
+            pairs.setdefault(path, base + OUTPUT_EXT[command])
+    return pairs
+
+
+def find_output_collisions(pairs):
+    """
+    同じ出力先になる入力（a.yaml と a.yml、-o で別フォルダの同じ名前など）を探す。
+    戻り値は {入力: 出力先がかぶったほかの入力のリスト}
+    """
+    owners = {}
+    for src, dst in pairs.items():
+        owners.setdefault(os.path.normcase(os.path.abspath(dst)), []).append(src)
+    return {src: [other for other in srcs if other != src]
+            for srcs in owners.values() if len(srcs) > 1 for src in srcs}
+
+
+def is_up_to_date(input_path, output_path):
+    """出力が入力より新しければ True（変換しなくてよい）"""
+    try:
+        return os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+    except OSError:
+        return False
+
+
+def batch(command, targets, out_dir=None, jobs=None, force=False, stream=False):
+    """たくさんのファイルをプロセスを分けて変換する。エラーがあっても最後まで続ける"""
+    started = time.perf_counter()
+    pairs = collect_batch_inputs(command, targets, out_dir)
+    # 出力先がかぶる入力は、どれかが上書きされてしまうのでどれも変換せずエラーにする
+    collisions = find_output_collisions(pairs)
+    for src, others in collisions.items():
+        print(f"エラー: {src}: 出力先 {pairs[src]} が {', '.join(others)} とかぶるので変換しません",
+              file=sys.stderr)
+    tasks = [(command, src, dst, stream) for src, dst in pairs.items()
+             if src not in collisions and (force or not is_up_to_date(src, dst))]
+    skipped = len(pairs) - len(collisions) - len(tasks)
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            # 小さいファイルが多いので、いくつかまとめてワーカーに渡す
+            chunksize = max(1, min(64, len(tasks) // (jobs * 4)))
+            results = list(pool.map(convert_file, tasks, chunksize=chunksize))
+    else:
+        results = [convert_file(task) for task in tasks]
+
+    errors = len(collisions)
+    for (_, src, _, _), error in zip(tasks, results):
+        if error:
+            errors += 1
+            print(f"エラー: {src}: {error}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    converted = len(tasks) - (errors - len(collisions))
+    rate = len(tasks) / elapsed if elapsed > 0 else 0
+    print(f"変換 {converted} / スキップ {skipped} / エラー {errors} ファイル"
+          f"（{elapsed:.2f} 秒, {rate:.1f} ファイル/秒, jobs={jobs}, libyaml={'あり' if LIBYAML else 'なし'}）")
+    return errors
+
+
+def write_sample_json(path, size_mb):
+    """ベンチマーク用に、だいたい size_mb MB の JSON（レコードの配列）を少しずつ書き出す"""
+    target = size_mb * 1024 * 1024
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"users": [')
+        written = 0
+        i = 0
+        while written < target:
+            record = {
+                'id': i, 'name': f'ユーザー{i}', 'score': i * 0.5, 'active': i % 3 == 0,
+                'tags': ['python', 'yaml', str(i % 7)], 'memo': None,
+                'address': {'zip': f'{i % 1000:03d}-{i % 10000:04d}', 'city': 'Tokyo'},
+            }
+            text = (',' if i else '') + json.dumps(record, ensure_ascii=False)
+            f.write(text)
+            written += len(text.encode('utf-8'))
+            i += 1
+        f.write(']}')
+    return i
+
+
+def run_measured(args):
+    """子プロセスで args を実行し、(秒数, 最大メモリ MB) を返す（os.wait4 を使うので Unix のみ）"""
+    started = time.perf_counter()
+    proc = subprocess.Popen(args)
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - started
+    if status != 0:
+        raise RuntimeError(f'失敗しました: {" ".join(args)}')
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # ru_maxrss は Linux では KB、macOS ではバイト
+    return elapsed, usage.ru_maxrss / scale
+
+
+def bench(sizes):
+    """いろいろな大きさの JSON で、ふつうの変換とストリーミング変換の時間と最大メモリを比べる"""
+    print(f"{'大きさ':>6} {'方向':<8} {'モード':<10} {'秒':>7} {'MB/s':>7} {'最大メモリ':>10}")
+    with tempfile.TemporaryDirectory() as work:
+        for size in sizes:
+            src = os.path.join(work, f'sample_{size}.json')
+            write_sample_json(src, size)
+            mid = os.path.join(work, 'out.yaml')
+            for command, inp, out in [('to_yaml', src, mid), ('to_json', mid, os.path.join(work, 'out.json'))]:
+                in_mb = os.path.getsize(inp) / (1024 * 1024)
+                for mode in ('normal', 'stream'):
+                    args = [sys.executable, __file__, command, inp, out] + (['--stream'] if mode == 'stream' else [])
+                    elapsed, rss = run_measured(args)
+                    print(f'{size:>4}MB {command:<8} {mode:<10} {elapsed:7.2f} {in_mb / elapsed:7.2f} {rss:8.1f}MB', flush=True)
+
+
 def main():
     parser = argparse.ArgumentParser(
         prog='converter.py',
@@ -65,12 +526,38 @@ def main():
     p2.add_argument('input', help='入力YAMLファイル名（例: sample.yaml）')
     p2.add_argument('output', help='出力JSONファイル名（例: result.json）')
 
+    # 大きなファイルは --stream で少しずつ変換する（メモリをあまり使わない）
+    for p in (p1, p2):
+        p.add_argument('--stream', action='store_true',
+                       help='ファイル全体を読みこまず、少しずつ変換します（大きなファイル向け）')
+
+    # フォルダやグロブでまとめて変換
+    p4 = sub.add_parser('batch', help='たくさんのファイルをまとめて変換します')
+    p4.add_argument('direction', choices=['to_yaml', 'to_json'], help='変換の向き')
+    p4.add_argument('targets', nargs='+',
+                    help="フォルダ・ファイル・グロブ（例: configs/ 'data/**/*.json'）")
+    p4.add_argument('-o', '--out-dir', help='出力先フォルダ（省略すると入力ファイルの隣）')
+    p4.add_argument('-j', '--jobs', type=int, help='使うプロセス数（省略するとCPUの数）')
+    p4.add_argument('--force', action='store_true', help='出力のほうが新しくても変換しなおす')
+    p4.add_argument('--stream', action='store_true', help='1ファイルずつストリーミングで変換します')
+
+    # ふつうの変換とストリーミング変換の比較
+    p3 = sub.add_parser('bench', help='変換の速さと使うメモリを比べます')
+    p3.add_argument('--sizes', type=int, nargs='+', default=[1, 2, 4],
+                    help='試すJSONの大きさ（MB、スペース区切り）')
+
     args = parser.parse_args()
 
     if args.command == 'to_yaml':
-        to_yaml(args.input, args.output)
+        (to_yaml_stream if args.stream else to_yaml)(args.input, args.output)
     elif args.command == 'to_json':
-        to_json(args.input, args.output)
+        (to_json_stream if args.stream else to_json)(args.input, args.output)
+    elif args.command == 'batch':
+        if batch(args.direction, args.targets, out_dir=args.out_dir, jobs=args.jobs,
+                 force=args.force, stream=args.stream):
+            sys.exit(1)
+    elif args.command == 'bench':
+        bench(args.sizes)
     else:
         parser.print_help()
 
@@ -11,16 +11,30 @@
   再帰:       python image_size_reporter.py --dir "./A" "./B" --recursive
   MD出力:     python image_size_reporter.py --dir "./A" "./B" --format md --out report.md
   ソート:     python image_size_reporter.py --dir "./A" "./B" --sort area --reverse
+  並列:       python image_size_reporter.py --dir "./A" --recursive --jobs 16
+  速度比較:   python image_size_reporter.py --bench 3000
+  キャッシュ: python image_size_reporter.py --dir "./A" --format md --out report.md --cache
+  大量画像:   python image_size_reporter.py --dir "./A" --recursive --stream --sort size
+  重複検出:   python image_size_reporter.py --dir "./A" --format md --out report.md --dupes
+  サムネイル: python image_size_reporter.py --dir "./A" "./B" --thumbs ./thumbs --sheet --jobs 8
 """
 from __future__ import annotations
 import argparse
 import csv
+import heapq
+import os
+import sqlite3
+import struct
 import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Tuple, Optional
+from typing import Iterable, Iterator, List, Tuple, Optional
 
-from PIL import Image  # pip install pillow
+# Pillow（pip install pillow）はヘッダーだけで読めない画像のときに使うので、必要になってから import する
 
 VALID_EXTS = {".jpg", ".jpeg", ".png"}
 
@@ -39,6 +53,36 @@ class ImageInfo:
         return self.width * self.height
 
 
+class ImageRow:
+    """
+    ストリーミング用の軽い記録（__slots__ でメモリを節約）。
+    ImageInfo と同じ名前の属性を持つので、同じ書き出し関数・並び替えキーが使える。
+    root / path は文字列のまま持つ。
+    """
+    __slots__ = ("root", "path", "rel_path", "width", "height", "size_kb", "format")
+
+    def __init__(self, root: str, path: str, rel_path: str, width: int, height: int,
+                 size_kb: float, format: str):
+        self.root = root
+        self.path = path
+        self.rel_path = rel_path
+        self.width = width
+        self.height = height
+        self.size_kb = size_kb
+        self.format = format
+
+    @property
+    def area(self) -> int:
+        return self.width * self.height
+
+    def to_fields(self) -> list:
+        return [self.root, self.path, self.rel_path, self.width, self.height, self.size_kb, self.format]
+
+    @classmethod
+    def from_fields(cls, f: list) -> "ImageRow":
+        return cls(f[0], f[1], f[2], int(f[3]), int(f[4]), float(f[5]), f[6])
+
+
 def find_images(root: Path, recursive: bool) -> Iterable[Path]:
     """root直下（または再帰）からJPEG/PNGを列挙"""
     if recursive:
@@ -47,12 +91,105 @@ def find_images(root: Path, recursive: bool) -> Iterable[Path]:
         yield from (p for p in root.iterdir() if p.is_file() and p.suffix.lower() in VALID_EXTS)
 
 
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# 幅と高さが入っている JPEG の SOFn マーカー（C4/C8/CC は別物なので除く）
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+JPEG_MAX_SEGMENTS = 64  # これ以上マーカーをたどっても見つからなければ Pillow にまかせる
+
+
+def read_png_header(f) -> Optional[Tuple[int, int, str]]:
+    """PNG の IHDR チャンクから幅/高さを読む"""
+    head = f.read(24)
+    if len(head) < 24 or head[:8] != PNG_SIGNATURE or head[12:16] != b"IHDR":
+        return None
+    w, h = struct.unpack(">II", head[16:24])
+    return w, h, "PNG"
+
+
+def read_jpeg_header(f) -> Optional[Tuple[int, int, str]]:
+    """JPEG のマーカーをたどり、SOFn セグメントから幅/高さを読む（途中のデータは読みとばす）"""
+    if f.read(2) != b"\xff\xd8":
+        return None
+    for _ in range(JPEG_MAX_SEGMENTS):
+        b = f.read(1)
+        while b == b"\xff":  # 埋め草の 0xFF をとばす
+            b = f.read(1)
+        if not b:
+            return None
+        marker = b[0]
+        if marker in (0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7):
+            continue  # 長さを持たないマーカー
+        seg = f.read(2)
+        if len(seg) < 2:
+            return None
+        length = struct.unpack(">H", seg)[0]
+        if marker in JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            h, w = struct.unpack(">HH", data[1:5])
+            return (w, h, "JPEG") if w and h else None
+        if marker == 0xE2:
+            # MPF（複数画像）を持つ JPEG は Pillow だと "MPO" 扱いになるので任せる
+            if f.read(4) == b"MPF\x00":
+                return None
+            f.seek(length - 6, 1)
+            continue
+        if marker in (0xD9, 0xDA):  # 画像の終わり / 画像データの始まり
+            return None
+        f.seek(length - 2, 1)
+    return None
+
+
+def read_header_size(img_path: Path) -> Optional[Tuple[int, int, str]]:
+    """PNG/JPEG のヘッダーだけを読んで (幅, 高さ, 形式) を返す。読めなければ None。"""
+    try:
+        with open(img_path, "rb") as f:
+            sig = f.read(2)
+            f.seek(0)
+            if sig == b"\x89P":
+                return read_png_header(f)
+            if sig == b"\xff\xd8":
+                return read_jpeg_header(f)
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+def read_with_pillow(img_path: Path) -> Tuple[int, int, str]:
+    from PIL import Image  # pip install pillow
+    with Image.open(img_path) as im:
+        w, h = im.size
+        fmt = im.format or img_path.suffix.upper().lstrip(".")
+    return w, h, fmt
+
+
+def scan_images(root: str, recursive: bool) -> Iterator[Tuple[str, str, int]]:
+    """
+    os.scandir で JPEG/PNG を列挙し (絶対パス, root からの相対パス, バイト数) を返す。
+    DirEntry がキャッシュしている種類・stat 情報を使うので、余計なシステムコールが少ない。
+    """
+    stack = [(root, "")]
+    while stack:
+        folder, prefix = stack.pop()
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            stack.append((entry.path, os.path.join(prefix, entry.name)))
+                    elif os.path.splitext(entry.name)[1].lower() in VALID_EXTS and entry.is_file():
+                        yield entry.path, os.path.join(prefix, entry.name), entry.stat().st_size
+        except OSError as e:
+            print(f"[warn] フォルダを読めません: {folder} ({e})", file=sys.stderr)
+
+
 def read_image_info(img_path: Path) -> Optional[Tuple[int, int, float, str]]:
     """画像の幅/高さ/サイズKB/形式を読む。失敗したらNone。"""
     try:
-        with Image.open(img_path) as im:
-            w, h = im.size
-            fmt = im.format or img_path.suffix.upper().lstrip(".")
+        # まずはヘッダーだけで読み、変わった画像のときだけ Pillow で開く
+        w, h, fmt = read_header_size(img_path) or read_with_pillow(img_path)
         size_kb = round(img_path.stat().st_size / 1024, 1)
         return w, h, size_kb, fmt
     except Exception as e:
@@ -60,6 +197,477 @@ def read_image_info(img_path: Path) -> Optional[Tuple[int, int, float, str]]:
         return None
 
 
+def read_image_infos(paths: List[Path], jobs: int = 1,
+                     executor: str = "thread") -> Iterable[Optional[Tuple[int, int, float, str]]]:
+    """read_image_info を paths の順番どおりに返す。jobs > 1 ならスレッド/プロセスで並列に読む"""
+    if jobs <= 1:
+        yield from map(read_image_info, paths)
+        return
+    pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    with pool_cls(max_workers=jobs) as pool:
+        # プロセスのときは受け渡しの回数を減らすため、まとめて渡す
+        chunksize = max(1, len(paths) // (jobs * 4)) if executor == "process" else 1
+        yield from pool.map(read_image_info, paths, chunksize=chunksize)
+
+
+def open_cache(cache_path: Path) -> sqlite3.Connection:
+    """メタデータキャッシュ（SQLite）を開く。テーブルが無ければ作る"""
+    conn = sqlite3.connect(cache_path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS images (
+            path   TEXT PRIMARY KEY,
+            size   INTEGER NOT NULL,
+            mtime  INTEGER NOT NULL,
+            width  INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            format TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS hashes (
+            path  TEXT PRIMARY KEY,
+            mtime INTEGER NOT NULL,
+            hash  INTEGER NOT NULL
+        );
+    """)
+    return conn
+
+
+def read_image_infos_cached(paths: List[Path], cache_path: Path, jobs: int = 1,
+                            executor: str = "thread"):
+    """
+    キャッシュ（絶対パス＋サイズ＋更新時刻が同じなら再利用）を使って read_image_infos と同じ結果を返す。
+    新しい/変わったファイルだけ実際に読み、消えたファイルの行はキャッシュから取り除く。
+    戻り値は (結果のリスト, ヒット数, ミス数, 削除数)
+    """
+    conn = open_cache(cache_path)
+    cached = {row[0]: row[1:] for row in conn.execute(
+        "SELECT path, size, mtime, width, height, format FROM images")}
+
+    metas: List[Optional[Tuple[int, int, float, str]]] = [None] * len(paths)
+    misses: List[int] = []
+    stats = {}
+    for i, p in enumerate(paths):
+        key = os.path.abspath(p)
+        try:
+            st = os.stat(key)
+        except OSError:
+            misses.append(i)  # 読めない理由の警告は read_image_info に任せる
+            continue
+        stats[i] = (key, st.st_size, st.st_mtime_ns)
+        row = cached.pop(key, None)
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            metas[i] = (row[2], row[3], round(st.st_size / 1024, 1), row[4])
+        else:
+            misses.append(i)
+
+    fresh = read_image_infos([paths[i] for i in misses], jobs=jobs, executor=executor)
+    with conn:
+        for i, meta in zip(misses, fresh):
+            metas[i] = meta
+            if meta and i in stats:
+                key, size, mtime = stats[i]
+                w, h, _, fmt = meta
+                conn.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?)",
+                             (key, size, mtime, w, h, fmt))
+        # 今回見なかった行のうち、ファイルがもう無いものを削除
+        stale = [(key,) for key in cached if not os.path.exists(key)]
+        conn.executemany("DELETE FROM images WHERE path = ?", stale)
+    conn.close()
+    return metas, len(paths) - len(misses), len(misses), len(stale)
+
+
+HASH_SIZE = 8  # 8x8 = 64ビットの dHash
+REDUCIBLE_MODES = {"L", "LA", "RGB", "RGBA"}  # reduce() がそのまま使えるモード
+
+
+def reducible(im):
+    """P / 1 / I;16 / I などのモードは reduce() できないので、使えるモードにそろえる"""
+    if im.mode in REDUCIBLE_MODES:
+        return im
+    if im.mode in ("I", "F") or im.mode.startswith("I;"):
+        # 16ビットなどの画像は、そのまま L にすると 255 で頭打ちになるので 0〜255 に縮める
+        return im.convert("I").point(lambda v: v * (1 / 256)).convert("L")
+    if im.mode == "1":
+        return im.convert("L")
+    if im.mode in ("P", "PA") and (im.mode == "PA" or "transparency" in im.info):
+        return im.convert("RGBA")
+    return im.convert("RGB")
+
+
+def dhash(img_path: Path) -> Optional[int]:
+    """
+    見た目が近い画像ほど近い値になる 64ビットの知覚ハッシュ（dHash）を返す。
+    JPEG は draft()、PNG は reduce() で小さくしてから読むので、原寸で縮小するより速い。
+    """
+    from PIL import Image
+    try:
+        with Image.open(img_path) as im:
+            im.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))  # JPEG はここで縮小デコードされる
+            factor = min(im.size) // (HASH_SIZE * 4)
+            small = reducible(im)
+            small = small.reduce(factor) if factor > 1 else small
+            small = small.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    except Exception as e:
+        print(f"[warn] ハッシュ計算失敗: {img_path} ({e})", file=sys.stderr)
+        return None
+    px = small.tobytes()  # "L" モードなので1画素1バイト
+    value = 0
+    for y in range(HASH_SIZE):
+        row = px[y * (HASH_SIZE + 1):(y + 1) * (HASH_SIZE + 1)]
+        for x in range(HASH_SIZE):
+            value = (value << 1) | (row[x] > row[x + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """ハミング距離で「近いハッシュ」を速く探すための BK木"""
+
+    def __init__(self):
+        self.root = None  # [ハッシュ, 番号のリスト, {距離: 子ノード}]
+
+    def add(self, value: int, idx: int) -> None:
+        if self.root is None:
+            self.root = [value, [idx], {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                node[1].append(idx)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [idx], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_dist: int) -> List[int]:
+        """value との距離が max_dist 以下の番号をすべて返す"""
+        found: List[int] = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= max_dist:
+                found.extend(node[1])
+            # 三角不等式より、距離 d-max_dist 〜 d+max_dist の子だけ調べればよい
+            for cd, child in node[2].items():
+                if d - max_dist <= cd <= d + max_dist:
+                    stack.append(child)
+        return found
+
+
+def compute_hashes(paths: List[Path], cache_path: Path, jobs: int = 1) -> List[Optional[int]]:
+    """パス＋更新時刻でキャッシュしながら dHash を計算する"""
+    conn = open_cache(cache_path)
+    cached = {row[0]: row[1:] for row in conn.execute("SELECT path, mtime, hash FROM hashes")}
+    hashes: List[Optional[int]] = [None] * len(paths)
+    misses: List[Tuple[int, str, int]] = []
+    for i, p in enumerate(paths):
+        key = os.path.abspath(p)
+        try:
+            mtime = os.stat(key).st_mtime_ns
+        except OSError:
+            continue
+        row = cached.get(key)
+        if row and row[0] == mtime:
+            # SQLite の整数は符号付きなので、64ビット目が立っていると負の値で入っている
+            hashes[i] = row[1] & 0xFFFFFFFFFFFFFFFF
+        else:
+            misses.append((i, key, mtime))
+
+    if jobs > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            fresh = list(pool.map(dhash, [Path(key) for _, key, _ in misses]))
+    else:
+        fresh = [dhash(Path(key)) for _, key, _ in misses]
+    with conn:
+        for (i, key, mtime), h in zip(misses, fresh):
+            hashes[i] = h
+            if h is not None:
+                signed = h - (1 << 64) if h >= (1 << 63) else h
+                conn.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?)", (key, mtime, signed))
+    conn.close()
+    return hashes
+
+
+def find_duplicate_groups(hashes: List[Optional[int]], max_dist: int) -> List[List[int]]:
+    """ハミング距離 max_dist 以下でつながる画像どうしをグループにする（2件以上のものだけ）"""
+    tree = BKTree()
+    for i, h in enumerate(hashes):
+        if h is not None:
+            tree.add(h, i)
+
+    parent = list(range(len(hashes)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, h in enumerate(hashes):
+        if h is None:
+            continue
+        for j in tree.search(h, max_dist):
+            ri, rj = find(i), find(j)
+            if ri != rj:
+                parent[rj] = ri
+
+    groups: dict = {}
+    for i, h in enumerate(hashes):
+        if h is not None:
+            groups.setdefault(find(i), []).append(i)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def write_dupes(groups: List[List[ImageInfo]], out_path: Path, fmt: str) -> None:
+    """重複グループを、合計サイズの大きい順に書き出す"""
+    groups = sorted(groups, key=lambda g: sum(it.size_kb for it in g), reverse=True)
+    with out_path.open("w", newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(["group", "count", "group_size_kb", "root", "rel_path",
+                             "width_px", "height_px", "size_kb"])
+            for n, g in enumerate(groups, start=1):
+                total = round(sum(it.size_kb for it in g), 1)
+                for it in g:
+                    writer.writerow([n, len(g), total, str(it.root), it.rel_path,
+                                     it.width, it.height, it.size_kb])
+        else:
+            f.write("| group | count | group_size(kb) | root | rel_path | width(px) | height(px) | size(kb) |\n")
+            f.write("|---:|---:|---:|---|---|---:|---:|---:|\n")
+            for n, g in enumerate(groups, start=1):
+                total = round(sum(it.size_kb for it in g), 1)
+                for it in g:
+                    f.write(f"| {n} | {len(g)} | {total} | {it.root} | {it.rel_path} | "
+                            f"{it.width} | {it.height} | {it.size_kb} |\n")
+
+
+THUMB_SIZE = 256          # サムネイルの長い辺（px）
+SHEET_COLUMNS = 10        # コンタクトシートの横の枚数
+SHEET_MAX_TILES = 200     # 1枚のコンタクトシートに並べる最大数（超えたら次のページ）
+
+
+def make_thumbnail(src: str, dst: str, size: int = THUMB_SIZE) -> str:
+    """
+    サムネイルを1枚作る（プロセスプールから呼ばれる）。
+    JPEG は draft()、PNG は reduce() で小さくしてから縮小するので、原寸でのデコードを避けられる。
+    すでに新しいサムネイルがあれば作らない。戻り値は "made" / "skipped" / "failed"
+    """
+    from PIL import Image
+    try:
+        if os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+            return "skipped"
+        with Image.open(src) as im:
+            im.draft("RGB", (size, size))
+            factor = min(im.size) // (size * 2)
+            small = reducible(im)
+            small = small.reduce(factor) if factor > 1 else small.copy()
+        small.thumbnail((size, size))
+        if small.mode != "RGB":
+            bg = Image.new("RGB", small.size, "white")
+            bg.paste(small, mask=small.convert("RGBA").getchannel("A"))
+            small = bg
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        small.save(dst, "JPEG", quality=85)
+        return "made"
+    except Exception as e:
+        print(f"[warn] サムネイル作成失敗: {src} ({e})", file=sys.stderr)
+        return "failed"
+
+
+def thumb_path(thumbs_dir: Path, root_name: str, rel_path: str) -> Path:
+    # a.png と a.jpg がぶつからないよう、元の拡張子を残して .jpg を足す
+    return thumbs_dir / root_name / (rel_path + ".jpg")
+
+
+def make_contact_sheets(thumbs: List[Path], out_base: Path, size: int = THUMB_SIZE,
+                        columns: int = SHEET_COLUMNS) -> List[Path]:
+    """サムネイルをタイル状に並べたコンタクトシートを作る（多いときはページに分ける）"""
+    from PIL import Image
+    sheets: List[Path] = []
+    for page, start in enumerate(range(0, len(thumbs), SHEET_MAX_TILES), start=1):
+        tiles = thumbs[start:start + SHEET_MAX_TILES]
+        rows = (len(tiles) + columns - 1) // columns
+        sheet = Image.new("RGB", (columns * size, rows * size), "white")
+        for i, t in enumerate(tiles):
+            try:
+                with Image.open(t) as im:
+                    x = (i % columns) * size + (size - im.width) // 2
+                    y = (i // columns) * size + (size - im.height) // 2
+                    sheet.paste(im, (x, y))
+            except OSError as e:
+                print(f"[warn] シートに貼れません: {t} ({e})", file=sys.stderr)
+        name = out_base.name + ("" if page == 1 else f"_{page}") + ".jpg"
+        path = out_base.with_name(name)
+        sheet.save(path, "JPEG", quality=85)
+        sheets.append(path)
+    return sheets
+
+
+def generate_thumbnails(infos: List[ImageInfo], thumbs_dir: Path, jobs: int = 1,
+                        sheet: bool = False) -> None:
+    """全画像のサムネイルをプロセスプールで作り、必要ならルートごとにコンタクトシートを作る"""
+    # ルート名がかぶったら番号をつけて分ける
+    root_names: dict = {}
+    for it in infos:
+        if it.root not in root_names:
+            name = it.root.name or "root"
+            if name in root_names.values():
+                name = f"{name}_{len(root_names) + 1}"
+            root_names[it.root] = name
+
+    started = time.perf_counter()
+    jobs_list = [(str(it.path), str(thumb_path(thumbs_dir, root_names[it.root], it.rel_path)))
+                 for it in infos]
+    counts = {"made": 0, "skipped": 0, "failed": 0}
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as pool:
+        srcs, dsts = zip(*jobs_list)
+        chunksize = max(1, len(jobs_list) // (max(1, jobs) * 4))
+        for result in pool.map(make_thumbnail, srcs, dsts, chunksize=chunksize):
+            counts[result] += 1
+    print(f"[thumbs] 作成 {counts['made']} / 最新のためスキップ {counts['skipped']} / "
+          f"失敗 {counts['failed']} / {time.perf_counter() - started:.2f} 秒 ({thumbs_dir.resolve()})")
+
+    if not sheet:
+        return
+    started = time.perf_counter()
+    made: List[Path] = []
+    for root, name in root_names.items():
+        thumbs = [thumb_path(thumbs_dir, name, it.rel_path) for it in infos if it.root == root]
+        thumbs = [t for t in thumbs if t.exists()]
+        if thumbs:
+            made += make_contact_sheets(thumbs, thumbs_dir / f"{name}_sheet")
+    print(f"[sheet] {len(made)} 枚のコンタクトシート / {time.perf_counter() - started:.2f} 秒")
+
+
+def benchmark_header_reader(count: int) -> int:
+    """合成した画像 count 枚で、ヘッダー読みと Pillow の速さ・結果の一致を比べる。戻り値は不一致の数"""
+    import random
+    from PIL import Image
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths: List[Path] = []
+        for i in range(count):
+            size = (rng.randint(1, 640), rng.randint(1, 640))
+            mode = rng.choice(["RGB", "L", "RGBA", "P"])
+            if i % 2 == 0:
+                path = Path(tmp) / f"img{i}.png"
+                Image.new(mode, size).save(path)
+            else:
+                path = Path(tmp) / f"img{i}.jpg"
+                Image.new("L" if mode == "L" else "RGB", size).save(
+                    path, progressive=(i % 4 == 1), optimize=(i % 8 == 3))
+            paths.append(path)
+
+        started = time.perf_counter()
+        fast = [read_header_size(p) for p in paths]
+        fast_sec = time.perf_counter() - started
+
+        started = time.perf_counter()
+        slow = [read_with_pillow(p) for p in paths]
+        slow_sec = time.perf_counter() - started
+
+    mismatches = sum(1 for a, b in zip(fast, slow) if a is not None and a != b)
+    fallbacks = sum(1 for a in fast if a is None)
+    print(f"[bench] {count} 枚（PNG/JPEG 半々）")
+    print(f"[bench] ヘッダー読み: {fast_sec:.3f} 秒 / Pillow: {slow_sec:.3f} 秒 / "
+          f"{slow_sec / fast_sec if fast_sec else 0:.1f} 倍")
+    print(f"[bench] Pillow との不一致: {mismatches} 件 / Pillow に任せた数: {fallbacks} 件")
+    for path, a, b in zip(paths, fast, slow):
+        if a is not None and a != b:
+            print(f"[bench] 不一致: {path.name} ヘッダー={a} Pillow={b}", file=sys.stderr)
+    return mismatches
+
+
+def read_dims(path: str) -> Optional[Tuple[int, int, str]]:
+    """幅/高さ/形式だけを読む（サイズは scan_images で分かっているので stat しない）"""
+    try:
+        return read_header_size(Path(path)) or read_with_pillow(Path(path))
+    except Exception as e:
+        print(f"[warn] 読み込み失敗: {path} ({e})", file=sys.stderr)
+        return None
+
+
+def iter_rows(roots: List[Path], recursive: bool, jobs: int = 1) -> Iterator[ImageRow]:
+    """見つけた順に ImageRow を1件ずつ作る。jobs > 1 なら先読みする数を決めてスレッドで読む"""
+    def entries():
+        for root in roots:
+            root_abs = str(root.resolve())
+            for path, rel, size in scan_images(root_abs, recursive):
+                yield root_abs, path, rel, size
+
+    def to_row(entry, dims):
+        root_abs, path, rel, size = entry
+        w, h, fmt = dims
+        return ImageRow(root_abs, path, rel, w, h, round(size / 1024, 1), fmt)
+
+    if jobs <= 1:
+        for entry in entries():
+            dims = read_dims(entry[1])
+            if dims:
+                yield to_row(entry, dims)
+        return
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        window: deque = deque()
+        for entry in entries():
+            window.append((entry, pool.submit(read_dims, entry[1])))
+            if len(window) >= jobs * 4:
+                entry0, fut = window.popleft()
+                if fut.result():
+                    yield to_row(entry0, fut.result())
+        for entry0, fut in window:
+            if fut.result():
+                yield to_row(entry0, fut.result())
+
+
+SORT_RUN_SIZE = 100_000  # 外部ソートで1回にメモリで並べる件数
+
+
+def external_sort(rows: Iterable[ImageRow], key, reverse: bool = False,
+                  run_size: int = SORT_RUN_SIZE) -> Iterator[ImageRow]:
+    """
+    run_size 件ずつ並べて一時ファイルに書き出し、最後に heapq.merge でまとめる。
+    メモリに載るのは常に run_size 件程度。
+    """
+    with tempfile.TemporaryDirectory(prefix="imgsort_") as tmp:
+        run_paths: List[str] = []
+        buf: List[ImageRow] = []
+
+        def spill():
+            buf.sort(key=key, reverse=reverse)
+            path = os.path.join(tmp, f"run{len(run_paths)}.csv")
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows(r.to_fields() for r in buf)
+            run_paths.append(path)
+            buf.clear()
+
+        for row in rows:
+            buf.append(row)
+            if len(buf) >= run_size:
+                spill()
+        if not run_paths:
+            # 1回分に収まるならファイルに書かずに済ませる
+            buf.sort(key=key, reverse=reverse)
+            yield from buf
+            return
+        if buf:
+            spill()
+
+        files = [open(p, newline="", encoding="utf-8") for p in run_paths]
+        try:
+            runs = [map(ImageRow.from_fields, csv.reader(f)) for f in files]
+            yield from heapq.merge(*runs, key=key, reverse=reverse)
+        finally:
+            for f in files:
+                f.close()
+
+
 def sort_key_fn(key: str):
     if key == "name":   return lambda it: (str(it.rel_path).lower(), str(it.path).lower())
     if key == "width":  return lambda it: it.width
@@ -69,11 +677,14 @@ def sort_key_fn(key: str):
     return lambda it: (str(it.rel_path).lower(), str(it.path).lower())
 
 
-def write_csv(items: List[ImageInfo], out_path: Path) -> None:
+def write_csv(items: Iterable[ImageInfo], out_path: Path) -> int:
+    """1件ずつ書き出す（items はジェネレーターでもよい）。書いた件数を返す"""
+    count = 0
     with out_path.open("w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
         writer.writerow(["root", "rel_path", "format", "width_px", "height_px", "area_px", "size_kb", "abs_path"])
         for it in items:
+            count += 1
             writer.writerow([
                 str(it.root),
                 it.rel_path,
@@ -82,30 +693,63 @@ def write_csv(items: List[ImageInfo], out_path: Path) -> None:
                 it.height,
                 it.area,
                 it.size_kb,
-                str(it.path.resolve())
+                str(it.path)  # ImageInfo / ImageRow とも絶対パスで持っている
             ])
+    return count
 
 
-def write_markdown(items: List[ImageInfo], out_path: Path) -> None:
+def write_markdown(items: Iterable[ImageInfo], out_path: Path) -> int:
+    """1件ずつ書き出す（items はジェネレーターでもよい）。書いた件数を返す"""
+    count = 0
     with out_path.open("w", encoding="utf-8") as f:
         f.write("| root | rel_path | format | width(px) | height(px) | area(px) | size(kb) |\n")
         f.write("|---|---|---:|---:|---:|---:|---:|\n")
         for it in items:
+            count += 1
             f.write(f"| {it.root} | {it.rel_path} | {it.format} | {it.width} | {it.height} | {it.area} | {it.size_kb} |\n")
+    return count
 
 
 def main():
     parser = argparse.ArgumentParser(description="画像サイズレポーター（複数フォルダまとめ対応版）")
-    parser.add_argument("--dir", nargs="+", required=True,
+    parser.add_argument("--dir", nargs="+",
                         help="調べたいフォルダを1つ以上（スペース区切りで複数）")
     parser.add_argument("--recursive", action="store_true", help="サブフォルダも調べる")
     parser.add_argument("--format", choices=["csv", "md"], default="csv", help="出力形式")
     parser.add_argument("--out", help="出力ファイル名（例: report.csv / report.md）")
-    parser.add_argument("--sort", choices=["name", "width", "height", "area", "size"], default="name",
-                        help="並び順のキー")
+    parser.add_argument("--sort", choices=["name", "width", "height", "area", "size"],
+                        help="並び順のキー（既定: name。--stream では指定したときだけ並べる）")
     parser.add_argument("--reverse", action="store_true", help="降順にする")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="画像情報を並列に読む数（ネットワークドライブなどで効果大）")
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread",
+                        help="--jobs のときの並列方式（I/O待ちが多いなら thread）")
+    parser.add_argument("--cache", action="store_true",
+                        help="幅/高さ/形式をキャッシュして、変わったファイルだけ読み直す")
+    parser.add_argument("--cache-file",
+                        help="キャッシュの場所（既定: 出力ファイルの隣の <名前>.cache.sqlite）")
+    parser.add_argument("--dupes", action="store_true",
+                        help="見た目がほぼ同じ画像をグループにして <出力名>_dupes に書き出す")
+    parser.add_argument("--dupe-threshold", type=int, default=4,
+                        help="--dupes で同じとみなすハッシュの違い（0〜64、既定: 4）")
+    parser.add_argument("--thumbs", metavar="DIR",
+                        help="サムネイルを DIR に作る（--jobs 数のプロセスで並列。新しいものは作り直さない）")
+    parser.add_argument("--sheet", action="store_true",
+                        help="--thumbs のとき、フォルダごとのコンタクトシートも作る")
+    parser.add_argument("--stream", action="store_true",
+                        help="見つけた順に書き出し、メモリ使用量を一定に保つ（大量の画像向け）")
+    parser.add_argument("--bench", type=int, metavar="N",
+                        help="合成画像 N 枚でヘッダー読みと Pillow を比べて終了する")
     args = parser.parse_args()
 
+    if args.bench:
+        # 1件でも Pillow と食い違ったら失敗として終わる（CI などで確認に使える）
+        if benchmark_header_reader(args.bench):
+            sys.exit(1)
+        return
+    if not args.dir:
+        parser.error("--dir を指定してください")
+
     roots: List[Path] = [Path(p).expanduser() for p in args.dir]
     valid_roots: List[Path] = []
     for r in roots:
@@ -118,44 +762,89 @@ def main():
         print("[error] 有効なフォルダが1つもありません。--dir の指定を確認してください。")
         sys.exit(1)
 
+    default_name = "image_report.csv" if args.format == "csv" else "image_report.md"
+    out_path = Path(args.out) if args.out else Path(default_name)
+    writer = write_csv if args.format == "csv" else write_markdown
+
+    if args.stream:
+        if args.cache or args.cache_file or args.dupes or args.thumbs:
+            parser.error("--stream と --cache / --dupes / --thumbs は同時に使えません")
+        started = time.perf_counter()
+        rows = iter_rows(valid_roots, args.recursive, jobs=args.jobs)
+        if args.sort:
+            rows = external_sort(rows, sort_key_fn(args.sort), reverse=args.reverse)
+        count = writer(rows, out_path)
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed > 0 else 0
+        print(f"[done] {count} 件の画像を解析しました。出力: {out_path.resolve()}")
+        print(f"[stats] {elapsed:.2f} 秒 / {rate:.1f} 件/秒 (stream, jobs={args.jobs})")
+        return
+
+    started = time.perf_counter()
+    targets: List[Tuple[Path, Path]] = [(root, p) for root in valid_roots
+                                        for p in find_images(root, recursive=args.recursive)]
+    cache_note = ""
+    if args.cache or args.cache_file:
+        cache_path = Path(args.cache_file) if args.cache_file else out_path.with_suffix(".cache.sqlite")
+        metas, hits, misses, pruned = read_image_infos_cached(
+            [p for _, p in targets], cache_path, jobs=args.jobs, executor=args.executor)
+        cache_note = f"[cache] ヒット {hits} / ミス {misses} / 削除 {pruned} ({cache_path})"
+    else:
+        metas = read_image_infos([p for _, p in targets], jobs=args.jobs, executor=args.executor)
+
     infos: List[ImageInfo] = []
-    for root in valid_roots:
-        for p in find_images(root, recursive=args.recursive):
-            meta = read_image_info(p)
-            if not meta:
-                continue
-            w, h, size_kb, fmt = meta
-            try:
-                rel = str(p.relative_to(root))
-            except ValueError:
-                # まれに別ドライブなどで relative_to が失敗したら、ファイル名のみを相対扱いに
-                rel = p.name
-            infos.append(ImageInfo(
-                root=root.resolve(),
-                path=p.resolve(),
-                rel_path=rel,
-                width=w,
-                height=h,
-                size_kb=size_kb,
-                format=fmt
-            ))
+    for (root, p), meta in zip(targets, metas):
+        if not meta:
+            continue
+        w, h, size_kb, fmt = meta
+        try:
+            rel = str(p.relative_to(root))
+        except ValueError:
+            # まれに別ドライブなどで relative_to が失敗したら、ファイル名のみを相対扱いに
+            rel = p.name
+        infos.append(ImageInfo(
+            root=root.resolve(),
+            path=p.resolve(),
+            rel_path=rel,
+            width=w,
+            height=h,
+            size_kb=size_kb,
+            format=fmt
+        ))
+
+    elapsed = time.perf_counter() - started
 
     if not infos:
         print("[info] 画像が見つかりませんでした。拡張子(JPG/JPEG/PNG)やフォルダを確認してください。")
         return
 
     # 並び替え
-    infos.sort(key=sort_key_fn(args.sort), reverse=args.reverse)
+    infos.sort(key=sort_key_fn(args.sort or "name"), reverse=args.reverse)
 
     # 出力
-    default_name = "image_report.csv" if args.format == "csv" else "image_report.md"
-    out_path = Path(args.out) if args.out else Path(default_name)
-    if args.format == "csv":
-        write_csv(infos, out_path)
-    else:
-        write_markdown(infos, out_path)
+    writer(infos, out_path)
 
     print(f"[done] {len(infos)} 件の画像を解析しました。出力: {out_path.resolve()}")
+    rate = len(targets) / elapsed if elapsed > 0 else 0
+    print(f"[stats] 対象 {len(targets)} ファイル / {elapsed:.2f} 秒 / {rate:.1f} ファイル/秒 "
+          f"(jobs={args.jobs}, {args.executor})")
+    if cache_note:
+        print(cache_note)
+
+    if args.dupes:
+        started = time.perf_counter()
+        cache_path = Path(args.cache_file) if args.cache_file else out_path.with_suffix(".cache.sqlite")
+        hashes = compute_hashes([it.path for it in infos], cache_path, jobs=args.jobs)
+        groups = [[infos[i] for i in g] for g in find_duplicate_groups(hashes, args.dupe_threshold)]
+        dupes_path = out_path.with_name(f"{out_path.stem}_dupes{out_path.suffix}")
+        write_dupes(groups, dupes_path, args.format)
+        wasted = sum(sum(it.size_kb for it in g) - max(it.size_kb for it in g) for g in groups)
+        print(f"[dupes] {len(groups)} グループ / {sum(len(g) for g in groups)} 枚 / "
+              f"1枚ずつ残すと約 {wasted:,.1f} KB 減らせます / {time.perf_counter() - started:.2f} 秒")
+        print(f"[dupes] 出力: {dupes_path.resolve()}")
+
+    if args.thumbs:
+        generate_thumbnails(infos, Path(args.thumbs), jobs=args.jobs, sheet=args.sheet)
 
 
 if __name__ == "__main__":
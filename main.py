@@ -1,18 +1,43 @@
 # main.py
 # ーーーーーーーーーーーーーーーーーーーーーーーーーーーーーーーー
-# 支出管理アプリ（CSV保存・集計）
-# ・追加インストール不要（標準ライブラリのみ）
+# 支出管理アプリ（CSV保存・集計。SQLite保存も選べる）
+# ・追加インストール不要（標準ライブラリのみ。詳しい分析だけ NumPy を使う）
 # ・中学生でも読めるように、短く・やさしいコードとコメント
 # ーーーーーーーーーーーーーーーーーーーーーーーーーーーーーーーー
 from pathlib import Path
+import argparse
 import csv
+import io
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from calendar import monthrange
+from contextlib import closing
 from datetime import datetime
-from collections import defaultdict
+from functools import lru_cache
 
 # CSVファイルの場所（data/expenses.csv）
 DATA_DIR = Path("data")
 CSV_PATH = DATA_DIR / "expenses.csv"
 
+# SQLiteを使うときのデータベース（data/expenses.db）
+DB_PATH = DATA_DIR / "expenses.db"
+
+# 保存方式："csv"（既定）または "sqlite"
+# 環境変数 EXPENSES_BACKEND か、起動時の --backend で切りかえる
+BACKEND = os.environ.get("EXPENSES_BACKEND", "csv")
+
+# 集計キャッシュ（CSVのどこまで読んだか＋集計結果を覚えておく）
+AGG_PATH = DATA_DIR / "expenses.agg.json"
+# CSVが書きかえられていないか確かめるために覚えておく末尾のバイト数
+TAIL_CHECK = 64
+
+# 分析用の列データのスナップショット（NumPy の .npz 形式）
+COLUMNS_PATH = DATA_DIR / "expenses.columns.npz"
+
 # CSVヘッダー（列名）
 HEADERS = ["date", "category", "memo", "amount"]
 
@@ -24,6 +49,10 @@ def ensure_csv_exists():
             writer = csv.writer(f)
             writer.writerow(HEADERS)  # ヘッダー行
 
+def is_half_digits(s: str) -> bool:
+    """半角数字だけかチェック（isdigit は「²」なども通してしまい、int() で落ちる）"""
+    return s.isascii() and s.isdecimal()
+
 def valid_date(s: str) -> bool:
     """YYYY-MM-DD 形式かチェック"""
     try:
@@ -32,8 +61,46 @@ def valid_date(s: str) -> bool:
     except ValueError:
         return False
 
+def connect_db():
+    """SQLiteのデータベースを開く（テーブルと索引が無ければ作る）"""
+    DATA_DIR.mkdir(exist_ok=True)
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS expenses (
+            id       INTEGER PRIMARY KEY,
+            date     TEXT NOT NULL,
+            category TEXT NOT NULL,
+            memo     TEXT NOT NULL,
+            amount   INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS expenses_date ON expenses(date);
+        CREATE INDEX IF NOT EXISTS expenses_category ON expenses(category, date);
+    """)
+    return conn
+
+DATE_RE = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}")
+
+@lru_cache(maxsize=None)
+def days_in_month(year: int, month: int) -> int:
+    return monthrange(year, month)[1]
+
+def fast_valid_date(s: str) -> bool:
+    """
+    YYYY-MM-DD（0埋めの固定形式）かを、strptime を使わずに速く判定する（大量取りこみ用）。
+    形は正規表現で、月と日の範囲は数字で確かめる。
+    """
+    if len(s) != 10 or not DATE_RE.fullmatch(s):
+        return False
+    year, month, day = int(s[:4]), int(s[5:7]), int(s[8:])
+    return year >= 1 and 1 <= month <= 12 and 1 <= day <= days_in_month(year, month)
+
 def read_all():
-    """CSVの全行を読み込んで、辞書のリストで返す"""
+    """全行を読み込んで、辞書のリストで返す"""
+    if BACKEND == "sqlite":
+        with closing(connect_db()) as conn, conn:
+            return [dict(r) for r in conn.execute(
+                "SELECT date, category, memo, amount FROM expenses ORDER BY id")]
     ensure_csv_exists()
     rows = []
     with CSV_PATH.open("r", newline="", encoding="utf-8") as f:
@@ -48,12 +115,120 @@ def read_all():
     return rows
 
 def add_record(date:str, category:str, memo:str, amount:int):
-    """1件の支出をCSVに追加"""
+    """1件の支出を追加"""
+    if BACKEND == "sqlite":
+        with closing(connect_db()) as conn, conn:
+            conn.execute("INSERT INTO expenses (date, category, memo, amount) VALUES (?, ?, ?, ?)",
+                         (date, category, memo, amount))
+        return
     ensure_csv_exists()
     with CSV_PATH.open("a", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
         writer.writerow([date, category, memo, str(amount)])
 
+def write_batch(batch, out, fsync=False):
+    """まとめた行を一度に書きこむ（out はCSVのファイルか、SQLiteの接続）"""
+    if BACKEND == "sqlite":
+        out.executemany(
+            "INSERT INTO expenses (date, category, memo, amount) VALUES (?, ?, ?, ?)", batch)
+        out.commit()
+        return
+    csv.writer(out).writerows(batch)
+    if fsync:
+        out.flush()
+        os.fsync(out.fileno())
+
+def iter_import_rows(path):
+    """取りこむファイルを1行ずつ読む（.tsv はタブ区切り）。ヘッダーが無ければ列の順番で読む"""
+    delimiter = "\t" if str(path).lower().endswith(".tsv") else ","
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        first = next(reader, None)
+        if first is None:
+            return
+        if [c.strip().lower() for c in first[:4]] == HEADERS:
+            order = [0, 1, 2, 3]
+        elif set(HEADERS) <= {c.strip().lower() for c in first}:
+            names = [c.strip().lower() for c in first]
+            order = [names.index(h) for h in HEADERS]
+        else:
+            order = [0, 1, 2, 3]
+            yield 1, first, order
+        for line_no, row in enumerate(reader, start=2):
+            yield line_no, row, order
+
+def import_files(paths, batch_size=10000, fsync="end", rejects_path=None):
+    """
+    CSV/TSVファイルから支出をまとめて取りこむ。
+    - batch_size: 何行ずつまとめて書くか
+    - fsync: "batch"（まとめるたび）/ "end"（最後に1回）/ "none"（OSにまかせる）
+    - rejects_path: 取りこめなかった行の書き出し先（理由つき、前回までの分に追記する）
+    開けないファイルや UTF-8 で読めないファイルは、読めたところまで取りこんで次のファイルへ進む
+    （そのファイルも rejects に1行書き、はじいた数に数える）。
+    戻り値は (取りこんだ行数, はじいた行数, かかった秒数)
+    """
+    rejects_path = Path(rejects_path) if rejects_path else DATA_DIR / "import_rejects.csv"
+    start_time = time.perf_counter()
+    imported = rejected = 0
+    batch = []
+
+    if BACKEND == "sqlite":
+        out = connect_db()
+    else:
+        ensure_csv_exists()
+        out = CSV_PATH.open("a", newline="", encoding="utf-8", buffering=1024 * 1024)
+    rejects_file = rejects_writer = None
+
+    def reject(path, line_no, reason, row):
+        nonlocal rejects_file, rejects_writer, rejected
+        if rejects_file is None:
+            rejects_path.parent.mkdir(parents=True, exist_ok=True)
+            rejects_file = rejects_path.open("a", newline="", encoding="utf-8")
+            rejects_writer = csv.writer(rejects_file)
+            if rejects_file.tell() == 0:
+                rejects_writer.writerow(["file", "line", "reason", "row"])
+        rejects_writer.writerow([path, line_no, reason, "\t".join(row)])
+        rejected += 1
+
+    try:
+        for path in paths:
+            line_no = 0
+            try:
+                for line_no, row, order in iter_import_rows(path):
+                    reason = None
+                    if len(row) < 4:
+                        reason = "列が足りません"
+                    else:
+                        date, category, memo, amount = (row[i].strip() for i in order)
+                        if not fast_valid_date(date):
+                            reason = "日付の形式が正しくありません"
+                        elif not is_half_digits(amount):
+                            reason = "金額が半角数字ではありません"
+                    if reason:
+                        reject(path, line_no, reason, row)
+                        continue
+                    batch.append((date, category or "未分類", memo or "-",
+                                  int(amount) if BACKEND == "sqlite" else amount))
+                    if len(batch) >= batch_size:
+                        write_batch(batch, out, fsync=(fsync == "batch"))
+                        imported += len(batch)
+                        batch = []
+            except (OSError, UnicodeDecodeError) as e:
+                done = f"（{line_no} 行目までは読みました）" if line_no else ""
+                print(f"⚠️ {path} を読めません{done}: {e}", file=sys.stderr)
+                reject(path, line_no + 1, f"ファイルを読めません: {e}", [])
+        if batch:
+            write_batch(batch, out, fsync=(fsync in ("batch", "end")))
+            imported += len(batch)
+        elif fsync == "end" and BACKEND != "sqlite":
+            out.flush()
+            os.fsync(out.fileno())
+    finally:
+        out.close()
+        if rejects_file:
+            rejects_file.close()
+    return imported, rejected, time.perf_counter() - start_time
+
 def print_line(char="-", n=40):
     print(char * n)
 
@@ -74,26 +249,304 @@ def show_table(rows):
     print_line("=")
 
 def list_records():
-    rows = read_all()
+    show_table(query_records())
+
+def query_records(limit=None, offset=0, start=None, end=None, category=None):
+    """
+    日付の新しい順に記録を返す。
+    - limit / offset: 「新しい方から offset 件とばして limit 件」だけ取り出す
+    - start / end: 日付のはんい（YYYY-MM-DD、両はし含む）
+    - category: カテゴリでしぼりこむ
+    """
+    if BACKEND == "sqlite":
+        where, params = [], []
+        if start:
+            where.append("date >= ?")
+            params.append(start)
+        if end:
+            where.append("date <= ?")
+            params.append(end)
+        if category:
+            where.append("category = ?")
+            params.append(category)
+        sql = "SELECT date, category, memo, amount FROM expenses"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        # 索引（date）を使って新しい順に読むので、全件の並び替えはいらない
+        sql += " ORDER BY date DESC, id DESC LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+        with closing(connect_db()) as conn, conn:
+            return [dict(r) for r in conn.execute(sql, params)]
+
+    rows = [r for r in read_all()
+            if (not start or r["date"] >= start)
+            and (not end or r["date"] <= end)
+            and (not category or r["category"] == category)]
     # 日付の新しい順で並び替え
     rows.sort(key=lambda r: r["date"], reverse=True)
-    show_table(rows)
+    return rows[offset:] if limit is None else rows[offset:offset + limit]
+
+def migrate_csv_to_sqlite():
+    """今あるCSVの中身をまるごとSQLiteに移す（SQLite側は入れ直し）"""
+    ensure_csv_exists()
+    with CSV_PATH.open("r", newline="", encoding="utf-8") as f, closing(connect_db()) as conn, conn:
+        conn.execute("DELETE FROM expenses")
+        reader = csv.DictReader(f)
+        conn.executemany(
+            "INSERT INTO expenses (date, category, memo, amount) VALUES (?, ?, ?, ?)",
+            ((r["date"], r["category"], r["memo"], int(r["amount"])) for r in reader))
+        count = conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+    return count
+
+def empty_aggregates():
+    return {"offset": 0, "inode": None, "tail": "",
+            "month": {}, "category": {}, "month_category": {}}
+
+def load_aggregates():
+    """集計キャッシュを読む（無い・壊れているときは空から）"""
+    try:
+        with AGG_PATH.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return empty_aggregates()
+
+def save_aggregates(agg):
+    # 書きかけで壊れないよう、一時ファイルに書いてから置きかえる
+    tmp = AGG_PATH.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(agg, f, ensure_ascii=False)
+    tmp.replace(AGG_PATH)
+
+def read_tail(f, offset):
+    """offset の直前 TAIL_CHECK バイトを16進文字列で返す"""
+    start = max(0, offset - TAIL_CHECK)
+    f.seek(start)
+    return f.read(offset - start).hex()
+
+def read_appended_rows(state: dict):
+    """
+    CSVのうち state["offset"] より後ろに追記された行だけを読む。
+    CSVが作り直された・短くなった・途中が書きかえられたときは最初から読み直す。
+    state の offset / inode / tail は読んだ位置に合わせて書きかえる。
+    戻り値は (行のリスト, 最初から読み直したかどうか)
+    """
+    ensure_csv_exists()
+    st = CSV_PATH.stat()
+    with CSV_PATH.open("rb") as f:
+        offset = state["offset"]
+        # 前回の続きから読んでよいかチェック
+        reset = not (state["inode"] == st.st_ino and offset <= st.st_size
+                     and read_tail(f, offset) == state["tail"])
+        if reset:
+            offset = 0
+        f.seek(offset)
+        data = f.read()
+        # 最後の改行までの「完全な行」だけを使う（書きかけの行は次回）
+        end = data.rfind(b"\n") + 1
+        state["offset"] = offset + end
+        state["inode"] = st.st_ino
+        state["tail"] = read_tail(f, offset + end)
+
+    reader = csv.reader(io.StringIO(data[:end].decode("utf-8"), newline=""))
+    if offset == 0:
+        next(reader, None)  # ヘッダー行をとばす
+    return [row for row in reader if row], reset
+
+def update_aggregates():
+    """CSVに追記された行だけを読んで、集計キャッシュに足しこむ"""
+    agg = load_aggregates()
+    state = {k: agg[k] for k in ("offset", "inode", "tail")}
+    rows, reset = read_appended_rows(state)
+    if reset:
+        agg = empty_aggregates()
+    agg.update(state)
+    if not rows and not reset:
+        return agg
+
+    month, category, month_category = agg["month"], agg["category"], agg["month_category"]
+    for date, cat, _memo, amount in rows:
+        amount = int(amount)
+        ym = date[:7]  # 'YYYY-MM'
+        month[ym] = month.get(ym, 0) + amount
+        category[cat] = category.get(cat, 0) + amount
+        key = f"{ym}\t{cat}"  # 月×カテゴリ
+        month_category[key] = month_category.get(key, 0) + amount
+
+    save_aggregates(agg)
+    return agg
+
+def sum_by(sql_key):
+    """SQLite側で GROUP BY して合計を出す"""
+    with closing(connect_db()) as conn, conn:
+        return {k: v for k, v in conn.execute(
+            f"SELECT {sql_key} AS k, SUM(amount) FROM expenses GROUP BY k")}
 
 def summarize_by_month():
-    rows = read_all()
-    sums = defaultdict(int)  # key: 'YYYY-MM', value: 合計
-    for r in rows:
-        ym = r["date"][:7]  # 'YYYY-MM'
-        sums[ym] += r["amount"]
+    if BACKEND == "sqlite":
+        sums = sum_by("substr(date, 1, 7)")
+    else:
+        sums = update_aggregates()["month"]  # key: 'YYYY-MM', value: 合計
     show_summary_table(sums, "月ごとの合計（YYYY-MM）")
 
 def summarize_by_category():
-    rows = read_all()
-    sums = defaultdict(int)  # key: category, value: 合計
-    for r in rows:
-        sums[r["category"]] += r["amount"]
+    if BACKEND == "sqlite":
+        sums = sum_by("category")
+    else:
+        sums = update_aggregates()["category"]  # key: category, value: 合計
     show_summary_table(sums, "カテゴリごとの合計")
 
+# ーーー ここから詳しい分析（NumPy が必要：pip install numpy）ーーー
+
+def encode(values, names, index):
+    """文字列を番号に置きかえる（辞書エンコード）。新しい文字列は names に追加"""
+    codes = []
+    for v in values:
+        code = index.get(v)
+        if code is None:
+            code = index[v] = len(names)
+            names.append(v)
+        codes.append(code)
+    return codes
+
+def load_columns():
+    """
+    date / category / memo / amount を列ごとの配列にして返す。
+    - date: 1970-01-01 からの日数（int32）
+    - category / memo: 名前リストへの番号（int32）
+    - amount: 金額（int64）
+    CSVのときは COLUMNS_PATH に保存しておき、次回は追記された行だけを読む。
+    """
+    import numpy as np
+
+    if BACKEND == "sqlite":
+        with closing(connect_db()) as conn, conn:
+            rows = conn.execute("SELECT date, category, memo, amount FROM expenses").fetchall()
+        state, cols = None, None
+    else:
+        state = {"offset": 0, "inode": None, "tail": ""}
+        cols = None
+        try:
+            with np.load(COLUMNS_PATH) as snap:
+                cols = {k: snap[k] for k in snap.files}
+            state = json.loads(str(cols.pop("state")))
+        except (OSError, ValueError, KeyError):
+            cols = None
+        rows, reset = read_appended_rows(state)
+        if reset:
+            cols = None
+
+    if cols is None:
+        cols = {"day": np.empty(0, np.int32), "cat": np.empty(0, np.int32),
+                "memo": np.empty(0, np.int32), "amount": np.empty(0, np.int64),
+                "cat_names": np.empty(0, str), "memo_names": np.empty(0, str)}
+    if rows:
+        cat_names, memo_names = cols["cat_names"].tolist(), cols["memo_names"].tolist()
+        dates, cats, memos, amounts = zip(*rows)
+        new = {
+            # 日付の文字列は NumPy がまとめて解釈する
+            "day": np.array(dates, dtype="datetime64[D]").astype(np.int32),
+            "cat": np.array(encode(cats, cat_names, {n: i for i, n in enumerate(cat_names)}), np.int32),
+            "memo": np.array(encode(memos, memo_names, {n: i for i, n in enumerate(memo_names)}), np.int32),
+            "amount": np.array(amounts, dtype=np.int64),
+        }
+        for k, v in new.items():
+            cols[k] = np.concatenate([cols[k], v])
+        cols["cat_names"] = np.array(cat_names, dtype=str)
+        cols["memo_names"] = np.array(memo_names, dtype=str)
+    if state is not None and (rows or not COLUMNS_PATH.exists()):
+        with COLUMNS_PATH.open("wb") as f:
+            np.savez(f, state=np.array(json.dumps(state)), **cols)
+    return cols
+
+def category_monthly_trend(cols):
+    """カテゴリ×月の合計を {(カテゴリ, 'YYYY-MM'): 合計} で返す"""
+    import numpy as np
+    month = cols["day"].astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    first = month.min()
+    n_months = int(month.max() - first) + 1
+    key = cols["cat"].astype(np.int64) * n_months + (month - first)
+    sums = np.bincount(key, weights=cols["amount"], minlength=len(cols["cat_names"]) * n_months)
+    result = {}
+    for k in np.flatnonzero(sums):
+        cat, m = divmod(int(k), n_months)
+        ym = str(np.datetime64(int(first + m), "M"))
+        result[(str(cols["cat_names"][cat]), ym)] = int(sums[k])
+    return result
+
+def rolling_spend(cols, windows=(30, 90)):
+    """
+    各月末（データの最終日を含む）時点での、直近 N 日の合計を返す。
+    戻り値は {日付: {N: 合計}}
+    """
+    import numpy as np
+    day = cols["day"].astype(np.int64)
+    first = day.min()
+    daily = np.bincount(day - first, weights=cols["amount"])
+    cum = np.concatenate([[0], np.cumsum(daily)])
+    # 月末の日付（最後の月はデータの最終日）
+    ends = np.unique(day.astype("datetime64[D]").astype("datetime64[M]"))
+    end_days = (ends + 1).astype("datetime64[D]").astype(np.int64) - 1
+    end_days = np.minimum(end_days, day.max())
+    result = {}
+    for d in end_days:
+        i = int(d - first) + 1
+        result[str(np.datetime64(int(d), "D"))] = {
+            w: int(cum[i] - cum[max(0, i - w)]) for w in windows}
+    return result
+
+def amount_percentiles(cols, qs=(50, 90, 99)):
+    """全体とカテゴリごとの金額パーセンタイルを {名前: [値...]} で返す"""
+    import numpy as np
+    result = {"（全体）": np.percentile(cols["amount"], qs).tolist()}
+    order = np.argsort(cols["cat"], kind="stable")
+    cats, starts = np.unique(cols["cat"][order], return_index=True)
+    for cat, part in zip(cats, np.split(cols["amount"][order], starts[1:])):
+        result[str(cols["cat_names"][cat])] = np.percentile(part, qs).tolist()
+    return result
+
+def top_memos(cols, n=10):
+    """メモ（お店など）ごとの合計が大きい順に n 件を [(メモ, 合計)] で返す"""
+    import numpy as np
+    sums = np.bincount(cols["memo"], weights=cols["amount"], minlength=len(cols["memo_names"]))
+    top = np.argsort(sums, kind="stable")[::-1][:n]
+    return [(str(cols["memo_names"][i]), int(sums[i])) for i in top if sums[i] > 0]
+
+def show_analytics(top_n=10):
+    """詳しい分析をまとめて表示"""
+    try:
+        cols = load_columns()
+    except ImportError:
+        print("詳しい分析には NumPy が必要です（pip install numpy）。")
+        return
+    if len(cols["amount"]) == 0:
+        print("データがありません。")
+        return
+
+    print_line("=")
+    print("カテゴリ別・月ごとの推移")
+    print_line("-")
+    for (cat, ym), v in sorted(category_monthly_trend(cols).items()):
+        print(f"{cat:<10} {ym:<8} {v:>12,}")
+
+    print_line("=")
+    print("直近30日・90日の合計（各月末時点）")
+    print_line("-")
+    for d, sums in rolling_spend(cols).items():
+        print(f"{d:<12} 30日 {sums[30]:>12,}   90日 {sums[90]:>12,}")
+
+    print_line("=")
+    print("1件あたりの金額（中央値 / 90% / 99%）")
+    print_line("-")
+    for name, (p50, p90, p99) in amount_percentiles(cols).items():
+        print(f"{name:<10} {p50:>10,.0f} {p90:>10,.0f} {p99:>10,.0f}")
+
+    print_line("=")
+    print(f"メモ（お店など）別の合計 上位{top_n}")
+    print_line("-")
+    for memo, v in top_memos(cols, top_n):
+        print(f"{memo:<16} {v:>10,}")
+    print_line("=")
+
 def show_summary_table(counter: dict, title: str):
     if not counter:
         print("データがありません。")
@@ -121,22 +574,45 @@ def prompt_add():
     category = input("カテゴリ（例：食費/交通/趣味など）：").strip() or "未分類"
     memo = input("メモ（例：コンビニ、バス代など）：").strip() or "-"
     amount_str = input("金額（半角数字）：").strip()
-    if not amount_str.isdigit():
+    if not is_half_digits(amount_str):
         print("金額は半角数字で入力してください。")
         return
     amount = int(amount_str)
     add_record(date, category, memo, amount)
     print("✅ 追加しました！")
 
+def prompt_search():
+    """条件を聞いて、しぼりこんだ記録を表示"""
+    print("条件をつけて表示（空欄ならしぼりこまない）：")
+    start = input("いつから（YYYY-MM-DD）：").strip() or None
+    end = input("いつまで（YYYY-MM-DD）：").strip() or None
+    for d in (start, end):
+        if d and not valid_date(d):
+            print("日付の形式が正しくありません。例：2025-04-01")
+            return
+    category = input("カテゴリ：").strip() or None
+    limit_str = input("新しい方から何件（空欄で全部）：").strip()
+    page_str = input("何ページ目（空欄で1）：").strip() or "1"
+    if (limit_str and not is_half_digits(limit_str)) or not is_half_digits(page_str):
+        print("件数とページは半角数字で入力してください。")
+        return
+    limit = int(limit_str) if limit_str else None
+    offset = (int(page_str) - 1) * limit if limit and int(page_str) > 0 else 0
+    show_table(query_records(limit=limit, offset=offset,
+                             start=start, end=end, category=category))
+
 def main_menu():
-    ensure_csv_exists()
+    if BACKEND != "sqlite":
+        ensure_csv_exists()
     while True:
         print("\n===== 支出管理アプリ =====")
         print("1) 支出を追加する")
         print("2) 記録を一覧表示する")
         print("3) 月ごとに集計する")
         print("4) カテゴリごとに集計する")
-        print("5) 終了する")
+        print("5) 条件をつけて一覧表示する")
+        print("6) 詳しく分析する（NumPy）")
+        print("7) 終了する")
         choice = input("番号を入力してEnter：").strip()
 
         if choice == "1":
@@ -148,10 +624,52 @@ def main_menu():
         elif choice == "4":
             summarize_by_category()
         elif choice == "5":
+            prompt_search()
+        elif choice == "6":
+            show_analytics()
+        elif choice == "7":
             print("終了します。おつかれさま！")
             break
         else:
-            print("1〜5の番号で選んでください。")
+            print("1〜7の番号で選んでください。")
 
-if __name__ == "__main__":
+def main():
+    global BACKEND
+    parser = argparse.ArgumentParser(description="支出管理アプリ（CSV保存・集計）")
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default=BACKEND,
+                        help="保存方式（既定: csv）")
+    parser.add_argument("--migrate", action="store_true",
+                        help="CSVの中身をSQLiteへ移して終了する")
+    sub = parser.add_subparsers(dest="command")
+    p_import = sub.add_parser("import", help="CSV/TSVファイルから支出をまとめて取りこみます")
+    p_import.add_argument("files", nargs="+", help="取りこむファイル（.csv / .tsv、複数可）")
+    p_import.add_argument("--batch-size", type=int, default=10000, help="まとめて書く行数")
+    p_import.add_argument("--fsync", choices=["batch", "end", "none"], default="end",
+                          help="ディスクへ確実に書きこむタイミング（既定: end）")
+    p_import.add_argument("--rejects", help="取りこめなかった行の書き出し先"
+                                            "（既定: data/import_rejects.csv）")
+    p_analytics = sub.add_parser("analytics", help="推移・移動合計・パーセンタイル・上位メモを表示します")
+    p_analytics.add_argument("--top", type=int, default=10, help="上位メモの件数")
+    args = parser.parse_args()
+
+    if args.migrate:
+        count = migrate_csv_to_sqlite()
+        print(f"✅ {count} 件をSQLiteへ移しました: {DB_PATH}")
+        print("これから使うときは --backend sqlite を付けて起動してください。")
+        return
+    BACKEND = args.backend
+    if args.command == "import":
+        imported, rejected, elapsed = import_files(
+            args.files, batch_size=args.batch_size, fsync=args.fsync, rejects_path=args.rejects)
+        rate = imported / elapsed if elapsed > 0 else 0
+        print(f"✅ {imported:,} 件を取りこみました（{elapsed:.2f} 秒, {rate:,.0f} 行/秒）")
+        if rejected:
+            print(f"⚠️ {rejected:,} 件は取りこめませんでした（追記）: {args.rejects or DATA_DIR / 'import_rejects.csv'}")
+        return
+    if args.command == "analytics":
+        show_analytics(args.top)
+        return
     main_menu()
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,87 @@
 # phone_formatter.py
 import argparse
+import csv
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+# 全角数字 → 半角数字 の変換表（最初に1回だけ作る）
+FULLWIDTH_TABLE = str.maketrans("０１２３４５６７８９", "0123456789")
+NON_DIGIT_RE = re.compile(r"[^0-9]+")
+
+# 番号の頭の数字 → 区切り方 の表（総務省の番号計画をもとにした最長一致表）
+PREFIX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "phone_prefixes_jp.txt")
+_prefix_trie = None  # 最初に使うときに PREFIX_FILE から作る
 
 def only_digits(s: str) -> str:
-    """数字だけを取り出す（全角は想定外。基本は半角で入力してね）"""
-    return "".join(ch for ch in s if ch.isdigit())
+    """数字だけを取り出す（全角数字は半角にそろえる）"""
+    return NON_DIGIT_RE.sub("", s.translate(FULLWIDTH_TABLE))
+
+def load_prefix_trie():
+    """
+    PREFIX_FILE を読み、桁数ごとのプレフィックス木（数字1文字ずつの入れ子の辞書）を作る。
+    木のノードの "" キーに、そこまで一致したときの区切り方（例: (4, 2, 4)、付けないなら None）を入れる。
+    """
+    global _prefix_trie
+    if _prefix_trie is None:
+        trie = {}
+        with open(PREFIX_FILE, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                length, prefix, split = line.split()
+                node = trie.setdefault(int(length), {})
+                for ch in prefix:
+                    node = node.setdefault(ch, {})
+                node[""] = None if split == "-" else tuple(int(n) for n in split.split("-"))
+        _prefix_trie = trie
+    return _prefix_trie
+
+def lookup_split(d: str):
+    """
+    数字列 d の区切り方をプレフィックス木の最長一致で探す（O(桁数)）。
+    表にない桁数なら False、表で「区切らない」なら None を返す。
+    """
+    node = load_prefix_trie().get(len(d))
+    if node is None:
+        return False
+    split = node.get("", None)
+    for ch in d:
+        node = node.get(ch)
+        if node is None:
+            break
+        if "" in node:
+            split = node[""]
+    return split
+
+def split_digits(d: str, split) -> str:
+    parts, pos = [], 0
+    for n in split:
+        parts.append(d[pos:pos + n])
+        pos += n
+    return "-".join(parts)
 
 def add_hyphen_jp(raw: str) -> str:
     """
-    日本の“よくある”型でハイフンを付ける簡易フォーマッタ。
-    - 11桁: 3-4-4（090/080/070や050など）
-    - 10桁:
-        * 0120/0570: 4-3-3
-        * 03/06:     2-4-4
-        * それ以外:  3-3-4
-    それ以外の桁数は、数字のみ返す（無理にハイフンを付けない）。
+    日本の電話番号にハイフンを付ける。
+    市外局番の長さ（03 / 045 / 0465 / 04992 など）は、番号計画の表
+    （phone_prefixes_jp.txt）を頭から1桁ずつたどって決める。
+    - 11桁: 3-4-4（090/080/070や050など）、0800 は 4-3-4
+    - 10桁: 固定電話は市外局番の長さどおり（2-4-4 / 3-3-4 / 4-2-4 / 5-1-4）、
+            0120/0570 などは 4-3-3
+    表にない番号や、それ以外の桁数は、数字のみ返す（無理にハイフンを付けない）。
     """
     d = only_digits(raw)
 
-    # 11桁（携帯・050など）
-    if len(d) == 11:
-        return f"{d[:3]}-{d[3:7]}-{d[7:]}"
-
-    # 10桁（固定・フリーダイヤル等）
-    if len(d) == 10:
-        if d.startswith(("0120", "0570")):
-            return f"{d[:4]}-{d[4:7]}-{d[7:]}"
-        if d.startswith(("03", "06")):
-            return f"{d[:2]}-{d[2:6]}-{d[6:]}"
-        return f"{d[:3]}-{d[3:6]}-{d[6:]}"
+    split = lookup_split(d)
+    if split:
+        return split_digits(d, split)
 
-    # それ以外は数字だけ返す（安全側）
+    # 表にない番号・それ以外の桁数は数字だけ返す（安全側）
     return d
 
 def remove_hyphen(raw: str) -> str:
@@ -46,6 +98,198 @@ def toggle_format(raw: str) -> str:
     else:
         return add_hyphen_jp(raw)
 
+def convert(s: str, mode: str) -> str:
+    if mode == "add":
+        return add_hyphen_jp(s)
+    if mode == "remove":
+        return remove_hyphen(s)
+    return toggle_format(s)
+
+def convert_lines(lines, mode):
+    """1行1番号のかたまりを変換する（ワーカープロセスで動く）"""
+    return [convert(line.rstrip("\r\n"), mode) for line in lines]
+
+def convert_rows(rows, mode, column):
+    """CSVの行のかたまりの、指定した列だけを変換する（ワーカープロセスで動く）"""
+    for row in rows:
+        if column < len(row):
+            row[column] = convert(row[column], mode)
+    return rows
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def process_chunks(func, items, args, jobs, chunk_size):
+    """
+    items を chunk_size 件ずつ func(かたまり, *args) にかけ、結果を入力と同じ順で返す。
+    jobs > 1 ならプロセスで並列に処理する（同時に投げるのは jobs*4 個まで）。
+    """
+    if jobs <= 1:
+        for chunk in chunks(items, chunk_size):
+            yield from func(chunk, *args)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = deque()
+        for chunk in chunks(items, chunk_size):
+            pending.append(pool.submit(func, chunk, *args))
+            if len(pending) >= jobs * 4:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def run_batch(args, mode):
+    """標準入力またはファイルから大量の番号を読み、順番どおりに書き出す"""
+    src = open(args.input, "r", encoding="utf-8", newline="") if args.input else sys.stdin
+    dst = None  # 列が決まってから開く（列が見つからないときに出力ファイルを作らない・消さない）
+
+    def open_output():
+        return open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+
+    started = time.perf_counter()
+    count = 0
+    try:
+        if args.column is not None:
+            reader = csv.reader(src)
+            # 列名で指定したとき、または --header のときだけ1行目を見出しとして扱う
+            header = None
+            if args.header or not args.column.isdigit():
+                header = next(reader, None)
+                if header is None:
+                    dst = open_output()
+                    return
+            if args.column.isdigit():
+                column = int(args.column)
+            elif args.column in header:
+                column = header.index(args.column)
+            else:
+                raise SystemExit(f"エラー: 列が見つかりません: {args.column}")
+            dst = open_output()
+            writer = csv.writer(dst)
+            if header is not None:
+                writer.writerow(header)
+            for row in process_chunks(convert_rows, reader, (mode, column), args.jobs, args.chunk_size):
+                writer.writerow(row)
+                count += 1
+        else:
+            dst = open_output()
+            for line in process_chunks(convert_lines, src, (mode,), args.jobs, args.chunk_size):
+                dst.write(line + "\n")
+                count += 1
+    finally:
+        if args.input:
+            src.close()
+        if dst is not None:
+            if args.output:
+                dst.close()
+            else:
+                dst.flush()
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"[done] {count:,} 件 / {elapsed:.2f} 秒 / {rate:,.0f} 件/秒", file=sys.stderr)
+
+def build_prefix_table(path=PREFIX_FILE):
+    """
+    phonenumbers ライブラリ（pip install phonenumbers）の日本の書式データから
+    PREFIX_FILE を作り直す。区切り方は頭の6桁で決まるので、10万通りの頭6桁を
+    すべて調べ、親と同じ区切り方の子を省いて最長一致の表に縮める。
+    """
+    import phonenumbers
+
+    def groups(num):
+        try:
+            parsed = phonenumbers.parse(num, "JP")
+        except phonenumbers.NumberParseException:
+            return None
+        text = phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.NATIONAL)
+        if "-" not in text or text.replace("-", "") != num:
+            return None
+        return tuple(len(g) for g in text.split("-"))
+
+    lines = []
+    for length in (10, 11):
+        heads = {}
+        for i in range(100000):
+            head = f"0{i:05d}"
+            # 00 で始まるのは国際電話などの識別番号なので区切らない
+            heads[head] = None if head.startswith("00") else groups(head + "0" * (length - 6))
+
+        def compress(prefix):
+            """(このノードの区切り方, 上書きが必要な {プレフィックス: 区切り方})"""
+            if len(prefix) == 6:
+                return heads[prefix], {}
+            kids = [compress(prefix + str(n)) for n in range(10)]
+            counts = Counter(k[0] for k in kids)
+            default = next(k[0] for k in kids if counts[k[0]] == max(counts.values()))
+            entries = {}
+            for n, (value, sub) in enumerate(kids):
+                if value != default:
+                    entries[prefix + str(n)] = value
+                entries.update(sub)
+            return default, entries
+
+        default, entries = compress("0")
+        entries["0"] = default
+        for prefix in sorted(entries):
+            split = entries[prefix]
+            lines.append(f"{length} {prefix} {'-'.join(map(str, split)) if split else '-'}")
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# 日本の電話番号の区切り方（最長一致）。phone_formatter.py --build-table で生成\n")
+        f.write("# 出典: phonenumbers ライブラリの日本の書式データ（総務省の電気通信番号計画にもとづく）\n")
+        f.write("# 桁数 プレフィックス 区切り（- は区切らない）\n")
+        f.write("\n".join(lines) + "\n")
+    return len(lines)
+
+def run_bench(count):
+    """表のすべてのプレフィックスを含む番号と、ランダムな番号 count 件で速さと正しさを確かめる"""
+    rng = random.Random(0)
+
+    # 表の各行を、木を使わずに総当たりで最長一致させて答え合わせする
+    rows = []
+    with open(PREFIX_FILE, encoding="utf-8") as f:
+        for line in f:
+            if line.strip() and not line.startswith("#"):
+                length, prefix, split = line.split()
+                rows.append((int(length), prefix, split))
+
+    def expected(number):
+        best = max((r for r in rows if r[0] == len(number) and number.startswith(r[1])),
+                   key=lambda r: len(r[1]))
+        return best
+
+    errors = 0
+    lengths = Counter()
+    for length, prefix, split in rows:
+        # その行がいちばん長く一致する番号を作る（もっと長い行に当たったら作り直す）
+        for _ in range(100):
+            number = prefix + "".join(rng.choice("0123456789") for _ in range(length - len(prefix)))
+            if expected(number)[1] == prefix:
+                break
+        else:
+            continue
+        want = number if split == "-" else split_digits(number, [int(n) for n in split.split("-")])
+        if add_hyphen_jp(number) != want:
+            errors += 1
+            print(f"[check] 不一致: {number} → {add_hyphen_jp(number)}（期待: {want}）")
+        lengths[len(prefix)] += 1
+    print(f"[check] 表の {sum(lengths.values())} 行を確認（プレフィックスの長さ: "
+          f"{', '.join(f'{k}桁 {v}' for k, v in sorted(lengths.items()))}） / 不一致 {errors} 件")
+
+    numbers = ["0" + "".join(rng.choice("0123456789") for _ in range(rng.choice((9, 10))))
+               for _ in range(count)]
+    started = time.perf_counter()
+    for n in numbers:
+        add_hyphen_jp(n)
+    elapsed = time.perf_counter() - started
+    print(f"[bench] {count:,} 件 / {elapsed:.2f} 秒 / {count / elapsed:,.0f} 件/秒")
+
 def main():
     parser = argparse.ArgumentParser(
         description="電話番号フォーマッター（ハイフン入り↔なしを相互変換）"
@@ -60,6 +304,19 @@ def main():
         nargs="*",
         help="変換する電話番号（複数可）。未指定なら対話モードになります。",
     )
+    batch = parser.add_argument_group("大量変換（ストリーミング）")
+    batch.add_argument("--stdin", action="store_true", help="標準入力から1行1番号で読む")
+    batch.add_argument("-i", "--input", help="入力ファイル（1行1番号、または --column 付きでCSV）")
+    batch.add_argument("-c", "--column", help="CSVの変換する列（列名または0始まりの番号）")
+    batch.add_argument("--header", action="store_true",
+                       help="1行目を見出しとしてそのまま書き出す（--column を番号で指定したとき用）")
+    batch.add_argument("-o", "--output", help="出力ファイル（省略時は標準出力）")
+    batch.add_argument("-j", "--jobs", type=int, default=1, help="並列に処理するプロセス数")
+    batch.add_argument("--chunk-size", type=int, default=10000, help="1回にまとめて渡す件数")
+    parser.add_argument("--bench", type=int, metavar="N",
+                        help="表の全行の確認と、ランダムな N 件での速度測定をして終了する")
+    parser.add_argument("--build-table", action="store_true",
+                        help="phonenumbers ライブラリから phone_prefixes_jp.txt を作り直して終了する")
 
     args = parser.parse_args()
     mode = "toggle"
@@ -69,11 +326,21 @@ def main():
         mode = "remove"
 
     def convert_one(s: str) -> str:
-        if mode == "add":
-            return add_hyphen_jp(s)
-        if mode == "remove":
-            return remove_hyphen(s)
-        return toggle_format(s)
+        return convert(s, mode)
+
+    if args.build_table:
+        print(f"✅ {build_prefix_table()} 行を書き出しました: {PREFIX_FILE}")
+        return
+    if args.bench:
+        run_bench(args.bench)
+        return
+
+    # 大量変換モード
+    if args.stdin or args.input:
+        run_batch(args, mode)
+        return
+    if args.column is not None:
+        parser.error("--column は --input または --stdin と一緒に使ってください")
 
     # 引数に番号がある → まとめて処理
     if args.numbers:
@@ -1,6 +1,13 @@
 # search.py
 import argparse
+import mmap
 import os
+import re
+import sqlite3
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 def search_in_file(filepath, keyword):
     """ひとつのファイル内を検索し、キーワードを含む行を返す"""
@@ -12,6 +19,43 @@ def search_in_file(filepath, keyword):
                 results.append((num, line.rstrip()))
     return results
 
+COUNT_BLOCK = 16 * 1024 * 1024  # 改行を数えるときに一度に切り出すバイト数
+
+def count_newlines(mm, start, end):
+    """mm[start:end] の改行数を、ブロックごとにまとめて数える"""
+    total = 0
+    while start < end:
+        stop = min(start + COUNT_BLOCK, end)
+        total += mm[start:stop].count(b'\n')
+        start = stop
+    return total
+
+def search_in_file_mmap(filepath, keyword):
+    """
+    大きなファイル向けの高速版。ファイルを mmap してバイト列のまま検索し、
+    ヒットした行だけを文字列に直して (行番号, 行) を順に返すジェネレーター。
+    """
+    needle = keyword.encode('utf-8')
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0        # 次に探し始める位置
+            line_no = 1    # pos がある行の行番号
+            while True:
+                hit = mm.find(needle, pos)
+                if hit < 0:
+                    break
+                line_no += count_newlines(mm, pos, hit)
+                start = mm.rfind(b'\n', 0, hit) + 1
+                end = mm.find(b'\n', hit)
+                if end < 0:
+                    end = len(mm)
+                yield line_no, mm[start:end].decode('utf-8', errors='replace').rstrip()
+                # 同じ行で二重にヒットしないよう、次の行から探す
+                pos = end + 1
+                line_no += 1
+
 def search_in_folder(folder, keyword):
     """フォルダ内のすべての .txt ファイルを検索"""
     all_results = {}
@@ -23,23 +67,451 @@ def search_in_folder(folder, keyword):
                 all_results[fname] = matches
     return all_results
 
+def iter_txt_files(folder):
+    """os.scandir でサブフォルダまでたどり、.txt ファイルのパスを順に返す"""
+    stack = [folder]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith('.txt') and entry.is_file():
+                        yield entry.path
+        except OSError as e:
+            print(f'警告：フォルダを読めません: {current} ({e})', file=sys.stderr)
+
+def search_chunk(paths, keyword, use_mmap=False, patterns=None):
+    """
+    複数ファイルをまとめて検索する（プロセスプールの1タスク分）。
+    patterns=(キーワードのリスト, 正規表現のリスト) なら複数パターン検索をして、
+    (path, line_no, line, ヒットしたパターン名のリスト) を返す。
+    """
+    if patterns:
+        # 判定関数はプロセス間で渡せないので、ワーカーの中で作る
+        matcher = build_matcher(*patterns)
+        search = lambda path, _: search_in_file_multi(path, matcher)
+    else:
+        search = search_in_file_mmap if use_mmap else search_in_file
+    hits = []
+    for path in paths:
+        try:
+            for found in search(path, keyword):
+                hits.append((path, *found))
+        except (OSError, UnicodeDecodeError) as e:
+            print(f'警告：読み込み失敗: {path} ({e})', file=sys.stderr)
+    return hits
+
+def chunked(iterable, size):
+    """iterable を size 件ずつのリストに区切る"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def parallel_search(folder, keyword, workers=None, chunk_size=64, ordered=False,
+                    use_mmap=False, patterns=None):
+    """
+    フォルダを再帰的に検索し、(path, line_no, line) を見つかった順に返すジェネレーター。
+    patterns を渡すと複数パターン検索になり、(path, line_no, line, hits) を返す。
+    - workers: プロセス数（None なら CPU 数）
+    - chunk_size: 1タスクにまとめるファイル数
+    - ordered: True ならパス順にそろえて返す（既定は速い順＝順不同）
+    - use_mmap: True なら search_in_file_mmap で検索する
+    """
+    paths = iter_txt_files(folder)
+    if ordered:
+        paths = sorted(paths)
+    workers = workers or os.cpu_count() or 1
+    # 一度に投げるタスク数をしぼって、メモリを使いすぎないようにする
+    max_pending = workers * 4
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunks = chunked(paths, chunk_size)
+        if ordered:
+            # map は投げた順に結果を返すので、パス順のまま流せる
+            pending = []
+            for chunk in chunks:
+                pending.append(pool.submit(search_chunk, chunk, keyword, use_mmap, patterns))
+                if len(pending) >= max_pending:
+                    yield from pending.pop(0).result()
+            for fut in pending:
+                yield from fut.result()
+        else:
+            pending = set()
+            for chunk in chunks:
+                pending.add(pool.submit(search_chunk, chunk, keyword, use_mmap, patterns))
+                if len(pending) >= max_pending:
+                    done = next(as_completed(pending))
+                    pending.remove(done)
+                    yield from done.result()
+            for fut in as_completed(pending):
+                yield from fut.result()
+
+INDEX_NAME = '.search_index.sqlite'
+
+def default_index_path(folder):
+    """索引ファイルの既定の場所（フォルダ直下）"""
+    return os.path.join(folder, INDEX_NAME)
+
+def trigrams(text):
+    """文字列に含まれる3文字の組（トライグラム）の集合"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def open_index(db_path):
+    """索引DBを開く（テーブルが無ければ作る）"""
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS files (
+            id    INTEGER PRIMARY KEY,
+            path  TEXT UNIQUE NOT NULL,
+            size  INTEGER NOT NULL,
+            mtime INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS postings (
+            trigram TEXT NOT NULL,
+            file_id INTEGER NOT NULL,
+            lines   BLOB NOT NULL,
+            PRIMARY KEY (trigram, file_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS postings_file ON postings(file_id);
+    ''')
+    return conn
+
+def index_file(conn, file_id, path):
+    """1ファイル分のトライグラム→行番号リストを登録する"""
+    postings = {}
+    with open(path, encoding='utf-8') as f:
+        for num, line in enumerate(f, start=1):
+            for tri in trigrams(line.rstrip('\n')):
+                postings.setdefault(tri, []).append(num)
+    conn.executemany(
+        'INSERT INTO postings (trigram, file_id, lines) VALUES (?, ?, ?)',
+        ((tri, file_id, array('I', nums).tobytes()) for tri, nums in postings.items())
+    )
+
+def update_index(folder, db_path=None):
+    """
+    フォルダの索引を差分更新する。
+    パス・サイズ・更新時刻が変わったファイルだけ読み直し、消えたファイルは索引から外す。
+    パスは folder からの相対パスで覚えるので、どこから実行しても同じ索引を使える。
+    戻り値は (追加/更新した数, 変更なしの数, 削除した数)
+    """
+    conn = open_index(db_path or default_index_path(folder))
+    known = {path: (fid, size, mtime)
+             for fid, path, size, mtime in conn.execute('SELECT id, path, size, mtime FROM files')}
+    updated = unchanged = 0
+    with conn:
+        for path in iter_txt_files(folder):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            rel = os.path.relpath(path, folder)
+            old = known.pop(rel, None)
+            if old and old[1] == st.st_size and old[2] == st.st_mtime_ns:
+                unchanged += 1
+                continue
+            if old:
+                conn.execute('DELETE FROM postings WHERE file_id = ?', (old[0],))
+                conn.execute('DELETE FROM files WHERE id = ?', (old[0],))
+            cur = conn.execute('INSERT INTO files (path, size, mtime) VALUES (?, ?, ?)',
+                               (rel, st.st_size, st.st_mtime_ns))
+            try:
+                index_file(conn, cur.lastrowid, path)
+            except (OSError, UnicodeDecodeError) as e:
+                print(f'警告：索引を作れません: {path} ({e})', file=sys.stderr)
+            updated += 1
+        # 残ったものは削除されたファイル
+        for fid, _, _ in known.values():
+            conn.execute('DELETE FROM postings WHERE file_id = ?', (fid,))
+            conn.execute('DELETE FROM files WHERE id = ?', (fid,))
+    conn.close()
+    return updated, unchanged, len(known)
+
+def indexed_candidates(conn, keyword):
+    """
+    索引からキーワードを含みうる {ファイルの相対パス: 候補行番号の集合} を求める。
+    キーワードが3文字未満なら全ファイルが候補（行はしぼれないので None）。
+    """
+    tris = trigrams(keyword)
+    if not tris:
+        return {path: None for (path,) in conn.execute('SELECT path FROM files')}
+    candidates = None
+    for tri in tris:
+        found = {}
+        for fid, blob in conn.execute(
+                'SELECT file_id, lines FROM postings WHERE trigram = ?', (tri,)):
+            if candidates is not None and fid not in candidates:
+                continue
+            nums = set(array('I', blob))
+            if candidates is not None:
+                nums &= candidates[fid]
+            if nums:
+                found[fid] = nums
+        candidates = found
+        if not candidates:
+            return {}
+    paths = {}
+    for fid, nums in candidates.items():
+        row = conn.execute('SELECT path FROM files WHERE id = ?', (fid,)).fetchone()
+        if row:
+            paths[row[0]] = nums
+    return paths
+
+def search_lines(filepath, keyword, line_nums):
+    """
+    候補の行（line_nums、None ならすべて）だけキーワードを確かめる。
+    最後の候補行まで読んだら、残りは読まずに終える。
+    """
+    last = max(line_nums) if line_nums else None
+    results = []
+    with open(filepath, encoding='utf-8') as f:
+        for num, line in enumerate(f, start=1):
+            if last is not None and num > last:
+                break
+            if (line_nums is None or num in line_nums) and keyword in line:
+                results.append((num, line.rstrip()))
+    return results
+
+def search_with_index(folder, keyword, db_path=None):
+    """
+    索引で候補ファイル・候補行をしぼってから、その行だけを実際の部分一致で確かめる。
+    索引を作ったあとに変わったファイル・増えたファイル（サイズか更新時刻がちがうもの）は
+    索引を信じず全体を調べ、何件あったか警告する。
+    """
+    db_path = db_path or default_index_path(folder)
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f'索引がありません。先に index を実行してください: {db_path}')
+    conn = open_index(db_path)
+    try:
+        candidates = indexed_candidates(conn, keyword)
+        known = {path: (size, mtime)
+                 for path, size, mtime in conn.execute('SELECT path, size, mtime FROM files')}
+    finally:
+        conn.close()
+    targets = []  # (相対パス, パス, 候補行番号の集合 or None)
+    stale = 0
+    for path in iter_txt_files(folder):
+        rel = os.path.relpath(path, folder)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if known.get(rel) != (st.st_size, st.st_mtime_ns):
+            stale += 1
+            targets.append((rel, path, None))
+        elif rel in candidates:
+            targets.append((rel, path, candidates[rel]))
+    if stale:
+        print(f'警告：索引のあとに変わったファイルが {stale} 件あるので、全体を調べました'
+              f'（search.py index で索引を更新できます）', file=sys.stderr)
+    # 同じ行にすべてのトライグラムがそろうファイル（と索引が古いファイル）を、実際の部分一致で確かめる
+    for rel, path, line_nums in sorted(targets):
+        try:
+            matches = search_lines(path, keyword, line_nums)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f'警告：読み込み失敗: {path} ({e})', file=sys.stderr)
+            continue
+        for num, line in matches:
+            yield path, num, line
+
+def load_patterns(path):
+    """パターンファイル（1行に1キーワード、空行と # で始まる行は無視）を読む"""
+    with open(path, encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f
+                if line.strip() and not line.startswith('#')]
+
+def build_matcher(keywords, regexes=()):
+    """
+    キーワード（ただの文字列）は1つの正規表現にまとめ、正規表現はそれぞれ別にコンパイルする。
+    （正規表現までまとめると、\\1 などのグループ番号や同じグループ名がぶつかってしまう）
+    戻り値は (キーワードをまとめた正規表現 or None, [正規表現の判定関数, ...], [(表示名, 判定関数), ...])
+    """
+    combined = re.compile('|'.join(re.escape(k) for k in keywords)) if keywords else None
+    regex_checks = [re.compile(r).search for r in regexes]
+    checks = [(k, (lambda line, k=k: k in line)) for k in keywords]
+    checks += [(f'/{r}/', check) for r, check in zip(regexes, regex_checks)]
+    return combined, regex_checks, checks
+
+def search_in_file_multi(filepath, matcher):
+    """
+    1回の読み込みで全パターンを調べ、(行番号, 行, ヒットしたパターン名のリスト) を返す。
+    まずキーワードをまとめた正規表現と各正規表現で判定し、当たった行だけ個別のパターンを確かめる。
+    """
+    combined, regex_checks, checks = matcher
+    results = []
+    with open(filepath, encoding='utf-8') as f:
+        for num, line in enumerate(f, start=1):
+            if (combined and combined.search(line)) or any(check(line) for check in regex_checks):
+                hits = [name for name, check in checks if check(line)]
+                results.append((num, line.rstrip(), hits))
+    return results
+
+def benchmark_multi(paths, keywords, regexes=()):
+    """パターンごとに N 回検索する場合と、まとめて1回で検索する場合の時間を比べる"""
+    start = time.perf_counter()
+    separate_hits = 0
+    for k in keywords:
+        for path in paths:
+            separate_hits += len(search_in_file(path, k))
+    for r in regexes:
+        rx = re.compile(r)
+        for path in paths:
+            with open(path, encoding='utf-8') as f:
+                separate_hits += sum(1 for line in f if rx.search(line))
+    separate = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = build_matcher(keywords, regexes)
+    multi_hits = 0
+    for path in paths:
+        for _, _, hits in search_in_file_multi(path, matcher):
+            multi_hits += len(hits)
+    multi = time.perf_counter() - start
+    return separate, multi, separate_hits, multi_hits
+
+def bench_main(argv):
+    """bench サブコマンド：複数パターン検索のベンチマーク"""
+    parser = argparse.ArgumentParser(
+        prog='search.py bench',
+        description='N 個のパターンを別々に検索する場合と、1回でまとめて検索する場合を比べます。'
+    )
+    parser.add_argument('target', help='検索対象のフォルダまたはファイルパス')
+    parser.add_argument('-e', '--pattern', action='append', default=[], help='キーワード（複数回指定可）')
+    parser.add_argument('-f', '--patterns-file', help='キーワードを1行に1つ書いたファイル')
+    parser.add_argument('--regex', action='append', default=[], help='正規表現（複数回指定可）')
+    args = parser.parse_args(argv)
+
+    keywords = args.pattern + (load_patterns(args.patterns_file) if args.patterns_file else [])
+    if not keywords and not args.regex:
+        print('エラー：パターンを1つ以上指定してください。')
+        return
+    if os.path.isdir(args.target):
+        paths = sorted(iter_txt_files(args.target))
+    elif os.path.isfile(args.target):
+        paths = [args.target]
+    else:
+        print('エラー：フォルダまたはファイルが見つかりません。')
+        return
+
+    separate, multi, separate_hits, multi_hits = benchmark_multi(paths, keywords, args.regex)
+    n = len(keywords) + len(args.regex)
+    print(f'ファイル数: {len(paths)} / パターン数: {n}')
+    print(f'別々に {n} 回: {separate:.3f} 秒（ヒット {separate_hits} 件）')
+    print(f'まとめて 1 回: {multi:.3f} 秒（ヒット {multi_hits} 件）')
+    if multi > 0:
+        print(f'速度比: {separate / multi:.1f} 倍')
+
+def index_main(argv):
+    """index サブコマンド：フォルダの索引を作成・差分更新する"""
+    parser = argparse.ArgumentParser(
+        prog='search.py index',
+        description='フォルダ内の .txt ファイルのトライグラム索引を作成・更新します。'
+    )
+    parser.add_argument('folder', help='索引を作るフォルダ')
+    parser.add_argument('--db', help=f'索引ファイルの場所（既定: フォルダ内の {INDEX_NAME}）')
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.folder):
+        print('エラー：フォルダが見つかりません。')
+        return
+    updated, unchanged, removed = update_index(args.folder, args.db)
+    print(f'索引を更新しました：更新 {updated} 件 / 変更なし {unchanged} 件 / 削除 {removed} 件')
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'index':
+        index_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        bench_main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(
         description='フォルダ（またはファイル）内でキーワード検索を行います。'
     )
     parser.add_argument('target', help='検索対象のフォルダまたはファイルパス')
-    parser.add_argument('keyword', help='検索するキーワード')
+    parser.add_argument('keyword', nargs='?', help='検索するキーワード')
+    parser.add_argument('-e', '--pattern', action='append', default=[],
+                        help='追加のキーワード（複数回指定可。指定すると複数パターンを1回で検索）')
+    parser.add_argument('-f', '--patterns-file', help='キーワードを1行に1つ書いたファイル')
+    parser.add_argument('--regex', action='append', default=[],
+                        help='正規表現パターン（複数回指定可）')
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help='サブフォルダも含めて並列で検索する')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='--recursive 時のプロセス数（既定: CPU数）')
+    parser.add_argument('--chunk-size', type=int, default=64,
+                        help='--recursive 時に1タスクへまとめるファイル数')
+    parser.add_argument('--sort', action='store_true',
+                        help='--recursive 時に結果をパス順で出力する（既定は見つかった順）')
+    parser.add_argument('--mmap', action='store_true',
+                        help='巨大ファイル向けに mmap + バイト列検索で調べる（ファイル指定時・--recursive 時）')
+    parser.add_argument('--index', action='store_true',
+                        help='index サブコマンドで作った索引を使って検索する')
+    parser.add_argument('--db', help='--index 時の索引ファイルの場所')
     args = parser.parse_args()
 
-    if os.path.isdir(args.target):
-        results = search_in_folder(args.target, args.keyword)
+    keywords = ([args.keyword] if args.keyword else []) + args.pattern
+    if args.patterns_file:
+        keywords += load_patterns(args.patterns_file)
+    if not keywords and not args.regex:
+        parser.error('キーワードを指定してください（keyword / -e / -f / --regex）')
+    multi = len(keywords) + len(args.regex) > 1 or bool(args.regex)
+    keyword = None if multi else keywords[0]  # -e / -f で1つだけ指定したときもここに入る
+
+    if multi:
+        if args.mmap or args.index:
+            parser.error('--mmap と --index は、キーワード1つで検索するときだけ使えます')
+        try:
+            matcher = build_matcher(keywords, args.regex)
+        except re.error as e:
+            parser.error(f'正規表現が正しくありません: {e}')
+        if os.path.isdir(args.target) and args.recursive:
+            for path, num, line, hits in parallel_search(args.target, None,
+                                                         workers=args.jobs,
+                                                         chunk_size=args.chunk_size,
+                                                         ordered=args.sort,
+                                                         patterns=(keywords, args.regex)):
+                print(f'{path}:{num}: [{", ".join(hits)}] {line}')
+            return
+        if os.path.isdir(args.target):
+            paths = sorted(os.path.join(args.target, fname)
+                           for fname in os.listdir(args.target) if fname.endswith('.txt'))
+        elif os.path.isfile(args.target):
+            paths = [args.target]
+        else:
+            print('エラー：フォルダまたはファイルが見つかりません。')
+            return
+        for path in paths:
+            for num, line, hits in search_in_file_multi(path, matcher):
+                print(f'{path}:{num}: [{", ".join(hits)}] {line}')
+    elif os.path.isdir(args.target) and args.index:
+        try:
+            for path, num, line in search_with_index(args.target, keyword, args.db):
+                print(f'{path}:{num}: {line}')
+        except FileNotFoundError as e:
+            print(f'エラー：{e}')
+    elif os.path.isdir(args.target) and args.recursive:
+        for path, num, line in parallel_search(args.target, keyword,
+                                               workers=args.jobs,
+                                               chunk_size=args.chunk_size,
+                                               ordered=args.sort,
+                                               use_mmap=args.mmap):
+            print(f'{path}:{num}: {line}')
+    elif os.path.isdir(args.target):
+        results = search_in_folder(args.target, keyword)
         for fname, matches in results.items():
             print(f'--- {fname} ---')
             for num, line in matches:
                 print(f'{num}: {line}')
     elif os.path.isfile(args.target):
-        matches = search_in_file(args.target, args.keyword)
-        for num, line in matches:
+        search = search_in_file_mmap if args.mmap else search_in_file
+        for num, line in search(args.target, keyword):
             print(f'{num}: {line}')
     else:
         print('エラー：フォルダまたはファイルが見つかりません。')
@@ -4,26 +4,62 @@
 """
 シンプルTODO CLI
 機能: add / list / done
-保存先: ホームディレクトリに .todo_cli.json
+保存先: ホームディレクトリに .todo_cli.json（スナップショット）
+        と .todo_cli.journal.jsonl（追記だけの変更記録）、.todo_cli.json.idx（IDの索引）
 使い方:
   python todo.py add "牛乳を買う"
   python todo.py list
   python todo.py list --all
+  python todo.py list --grep 牛乳 --limit 20 --offset 20
+  python todo.py list --status done --done-from 2025-04-01 --json
   python todo.py done 3
+  python todo.py compact
+  python todo.py serve          # 常駐サーバーを起動（以後の add/done/list が速くなる）
+  python todo.py serve --stop   # 常駐サーバーを止める
+  python todo.py bench --count 10000
 """
 
 import argparse
+import heapq
 import json
+import os
+import re
+import socket
+import sys
+import tempfile
+import time
+from array import array
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 # 保存ファイル（各OSでユーザーのホームフォルダに置く）
 DATA_FILE = Path.home() / ".todo_cli.json"
+# add / done を1行ずつ追記していくジャーナル（JSON Lines）
+JOURNAL_FILE = Path.home() / ".todo_cli.journal.jsonl"
+# 次に使うIDを覚えておくファイル
+COUNTER_FILE = Path.home() / ".todo_cli.next_id"
+# スナップショットの中のタスクの位置（バイト）をIDで引くための索引
+INDEX_FILE = Path.home() / ".todo_cli.json.idx"
+# 書きこむ人を1人にするためのロックファイル（複数の todo.py が同時に動いてもIDが重ならない）
+LOCK_FILE = Path.home() / ".todo_cli.lock"
+# 常駐サーバーの待ち受けソケット（Unix ドメインソケット）
+SOCKET_PATH = Path.home() / ".todo_cli.sock"
+# 常駐サーバーが一度に確保しておくIDの数（落ちてもIDが重ならないよう先に進めておく）
+ID_RESERVE = 1000
+# ジャーナルがこの大きさを超えたら、スナップショットにまとめ直す
+COMPACT_BYTES = 256 * 1024
 
 def now_str():
     return datetime.now().strftime("%Y-%m-%d %H:%M")
 
-def load_tasks():
+def load_snapshot():
     if DATA_FILE.exists():
         try:
             with open(DATA_FILE, "r", encoding="utf-8") as f:
@@ -35,26 +71,607 @@ def load_tasks():
             print(f"⚠️ データが壊れていたのでバックアップしました: {backup}")
     return []
 
+def apply_event(by_id, event):
+    """ジャーナルの1行（イベント）をタスクの辞書に反映する。何度当てても同じ結果になる"""
+    if event["op"] == "add":
+        by_id.setdefault(event["task"]["id"], event["task"])
+    elif event["op"] == "done":
+        t = by_id.get(event["id"])
+        if t and not t["done"]:
+            t["done"] = True
+            t["done_at"] = event["at"]
+
+def load_tasks():
+    """
+    スナップショットを読み、ジャーナルのイベントを順に当てて今のタスク一覧を作る。
+    locked() の中で呼ぶこと。compact() と入れちがうと、新しいスナップショットを読む前に
+    空になったジャーナルを読んでしまい、まとめる前に追加したタスクが消えて見える。
+    """
+    by_id = {t["id"]: t for t in load_snapshot()}
+    if JOURNAL_FILE.exists():
+        with open(JOURNAL_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    apply_event(by_id, json.loads(line))
+                except (json.JSONDecodeError, KeyError):
+                    # 書きこみ途中で止まった最後の行などは無視する
+                    continue
+    return list(by_id.values())
+
+def write_atomic(path, data):
+    """一時ファイルに書いて fsync してから置きかえる（途中で落ちても壊れない）"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    # 同時に書く人がいても一時ファイルがぶつからないよう、名前は毎回ちがうものにする
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+@contextmanager
+def locked():
+    """
+    ジャーナル・カウンター・スナップショットを読み書きするあいだ、ほかの todo.py を待たせる。
+    同じプロセスの中で入れ子にすると止まってしまうので、1回の操作で1度だけ取ること。
+    """
+    with open(LOCK_FILE, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
 def save_tasks(tasks):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(tasks, f, ensure_ascii=False, indent=2)
+    """
+    id 順のタスクをスナップショットに書き、あわせて索引も作る。
+    索引は [スナップショットの大きさ, 更新時刻, 最初のID] のあとに、IDごとの (位置, 長さ) が並ぶ。
+    """
+    parts, spans = [], []
+    pos = len(b"[\n")
+    for t in tasks:
+        # json.dumps(tasks, indent=2) と同じ形になるよう、1件ずつ2文字下げて並べる
+        text = "  " + json.dumps(t, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        size = len(text.encode("utf-8"))
+        spans.append((t["id"], pos, size))
+        parts.append(text)
+        pos += size + len(b",\n")
+    write_atomic(DATA_FILE, "[\n" + ",\n".join(parts) + "\n]" if parts else "[]")
 
-def next_id(tasks):
-    return (max([t["id"] for t in tasks]) + 1) if tasks else 1
+    st = DATA_FILE.stat()
+    first = spans[0][0] if spans else 0
+    index = array("q", [st.st_size, st.st_mtime_ns, first])
+    for task_id, offset, size in spans:
+        # 使われなかったIDのところは (-1, 0) でうめる
+        index.extend([-1, 0] * (task_id - first - (len(index) - 3) // 2))
+        index.extend([offset, size])
+    write_atomic(INDEX_FILE, index.tobytes())
 
-def cmd_add(args):
-    tasks = load_tasks()
-    task = {
-        "id": next_id(tasks),
-        "title": args.title,
+def read_index_header(f, st):
+    """索引の先頭を読み、スナップショット（st）と合っていれば最初のIDを、合わなければ None を返す"""
+    header = array("q")
+    header.frombytes(f.read(24))
+    if len(header) < 3 or list(header[:2]) != [st.st_size, st.st_mtime_ns]:
+        return None
+    return header[2]
+
+def read_snapshot_task(task_id):
+    """
+    索引を使ってスナップショットから1件だけ読む。戻り値は (索引が使えたか, タスク or None)。
+    スナップショットが索引より新しい（古い版の todo.py が書いた）ときは使えない。
+    """
+    if not DATA_FILE.exists():
+        return True, None
+    try:
+        st = DATA_FILE.stat()
+        with open(INDEX_FILE, "rb") as f:
+            first = read_index_header(f, st)
+            if first is None:
+                return False, None
+            if task_id < first:
+                return True, None
+            f.seek(24 + (task_id - first) * 16)
+            entry = array("q")
+            entry.frombytes(f.read(16))
+    except (OSError, ValueError):
+        return False, None
+    if len(entry) < 2 or entry[0] < 0:  # 索引の最後より大きいID、または使われていないID
+        return True, None
+    with open(DATA_FILE, "rb") as f:
+        f.seek(entry[0])
+        return True, json.loads(f.read(entry[1]))
+
+def find_task(task_id):
+    """
+    ID で1件さがす。全タスクを読まずに、索引でスナップショットの1件と、
+    （COMPACT_BYTES までしか大きくならない）ジャーナルのうちそのIDのイベントだけを当てる。
+    """
+    usable, task = read_snapshot_task(task_id)
+    if not usable:
+        return next((t for t in load_tasks() if t["id"] == task_id), None)
+    by_id = {task_id: task} if task else {}
+    if JOURNAL_FILE.exists():
+        with open(JOURNAL_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                    if event.get("id", event.get("task", {}).get("id")) == task_id:
+                        apply_event(by_id, event)
+                except (json.JSONDecodeError, KeyError, AttributeError):
+                    continue
+    return by_id.get(task_id)
+
+def write_event(event):
+    """ジャーナルに1行追記する（ファイル全体を書き直さないので O(1)）。ロックは呼ぶ側で取る"""
+    with open(JOURNAL_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def compact_if_large():
+    if JOURNAL_FILE.exists() and JOURNAL_FILE.stat().st_size > COMPACT_BYTES:
+        compact()
+
+def append_event(event):
+    with locked():
+        write_event(event)
+    compact_if_large()
+
+def compact():
+    """スナップショット＋ジャーナルを新しいスナップショットにまとめ、ジャーナルを空にする"""
+    # まとめている間に追記されたイベントが消えないよう、最後までロックを持っておく
+    with locked():
+        tasks = sorted(load_tasks(), key=lambda t: t["id"])
+        save_tasks(tasks)
+        # ここで落ちてもイベントは何度当てても同じなので、次回読み直せば元どおり
+        write_atomic(JOURNAL_FILE, "")
+    return len(tasks)
+
+def read_counter(tasks=None):
+    """COUNTER_FILE の値（次に使うID）。無ければ全タスクから求める"""
+    try:
+        return int(COUNTER_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        if tasks is None:
+            tasks = load_tasks()
+        return (max([t["id"] for t in tasks]) + 1) if tasks else 1
+
+def next_id():
+    """
+    次のIDを払い出す。COUNTER_FILE に覚えておくので、全タスクを読まなくてよい。
+    先にカウンターを進めてから追記するので、途中で落ちてもIDが重なることはない。
+    ほかのプロセスと同じIDを取らないよう、呼ぶ側で locked() を取っておくこと。
+    """
+    new_id = read_counter()
+    write_atomic(COUNTER_FILE, str(new_id + 1))
+    return new_id
+
+def new_task(task_id, title):
+    return {
+        "id": task_id,
+        "title": title,
         "done": False,
         "created_at": now_str(),
         "done_at": None
     }
-    tasks.append(task)
-    save_tasks(tasks)
+
+def add_task(title):
+    """ファイルに直接タスクを追加する"""
+    with locked():
+        task = new_task(next_id(), title)
+        write_event({"op": "add", "task": task})
+    compact_if_large()
+    return task
+
+def done_task(task_id):
+    """ファイルに直接完了を記録する。戻り値は (状態, タイトル)"""
+    with locked():
+        t = find_task(task_id)
+        if t is None:
+            return "missing", None
+        if t["done"]:
+            return "already", t["title"]
+        write_event({"op": "done", "id": task_id, "at": now_str()})
+    compact_if_large()
+    return "done", t["title"]
+
+# ーーー 絞りこみ・ページ分け ーーー
+
+def make_filter(filters):
+    """
+    絞りこみ条件（辞書）から、タスクを受け取って True/False を返す関数を作る。
+    status: "pending" / "done" / "all"、grep: タイトルの部分一致、regex: タイトルの正規表現、
+    created_from / created_to / done_from / done_to: 日付（YYYY-MM-DD、両はし含む）
+    """
+    status = filters.get("status", "pending")
+    grep = filters.get("grep")
+    regex = re.compile(filters["regex"]) if filters.get("regex") else None
+    c_from, c_to = filters.get("created_from"), filters.get("created_to")
+    d_from, d_to = filters.get("done_from"), filters.get("done_to")
+
+    def match(t):
+        if status == "pending" and t["done"]:
+            return False
+        if status == "done" and not t["done"]:
+            return False
+        if grep and grep not in t["title"]:
+            return False
+        if regex and not regex.search(t["title"]):
+            return False
+        created = t["created_at"][:10]
+        if (c_from and created < c_from) or (c_to and created > c_to):
+            return False
+        if d_from or d_to:
+            done_at = (t["done_at"] or "")[:10]
+            if not done_at or (d_from and done_at < d_from) or (d_to and done_at > d_to):
+                return False
+        return True
+    return match
+
+def select_tasks(tasks, filters, limit=None, offset=0):
+    """
+    条件に合うタスクを新しい順（idの大きい順）に、offset 件とばして limit 件だけ順に返す。
+    - limit があるときは heapq で上位 offset+limit 件だけを持つ（全体は並べ替えない）
+    - limit が無く、tasks がすでに id 順なら、後ろから読むだけで並べ替えない
+    """
+    match = make_filter(filters)
+    if limit is not None:
+        top = heapq.nlargest(offset + limit, (t for t in tasks if match(t)), key=lambda t: t["id"])
+        yield from top[offset:]
+        return
+    if not isinstance(tasks, list):
+        tasks = list(tasks)
+    if all(tasks[i]["id"] < tasks[i + 1]["id"] for i in range(len(tasks) - 1)):
+        ordered = reversed(tasks)
+    else:
+        ordered = sorted(tasks, key=lambda t: t["id"], reverse=True)
+    skipped = 0
+    for t in ordered:
+        if match(t):
+            if skipped < offset:
+                skipped += 1
+                continue
+            yield t
+
+INDEX_BLOCK = 4096  # 索引を後ろから読むとき、一度に読むIDの数
+
+def iter_index_reverse(f, first):
+    """索引を後ろから少しずつ読み、(ID, 位置, 長さ) を新しい順に返す（使われていないIDはとばす）"""
+    count = (os.fstat(f.fileno()).st_size - 24) // 16
+    while count > 0:
+        start = max(0, count - INDEX_BLOCK)
+        f.seek(24 + start * 16)
+        block = array("q")
+        block.frombytes(f.read((count - start) * 16))
+        for i in range(count - start - 1, -1, -1):
+            if block[2 * i] >= 0:
+                yield first + start + i, block[2 * i], block[2 * i + 1]
+        count = start
+
+def stream_tasks(filters, limit=None, offset=0):
+    """
+    条件に合うタスクを新しい順に、offset 件とばして limit 件だけ、1件ずつ読みながら返す。
+    全タスクをリストにはせず、索引を後ろからたどってスナップショットの1件ずつを読み、
+    ジャーナル（COMPACT_BYTES までの大きさ）のイベントを重ねる。
+    スナップショット・索引・ジャーナルはロックの中で開いて読んでおくので、
+    表示のあいだに compact() で置きかわっても、同じ版を最後まで読める。
+    索引が使えないとき（古い版の todo.py が書いたなど）は、全件を読んで select_tasks にまかせる。
+    """
+    match = make_filter(filters)
+    snap = index = None
+    first = 0
+    added, done_at = {}, {}
+    with locked():
+        try:
+            snap = open(DATA_FILE, "rb")
+            index = open(INDEX_FILE, "rb")
+            first = read_index_header(index, os.fstat(snap.fileno()))
+        except FileNotFoundError:
+            first = 0 if snap is None else None
+        except (OSError, ValueError):
+            first = None
+        if first is None:
+            for f in (snap, index):
+                if f:
+                    f.close()
+            tasks = load_tasks()
+        elif JOURNAL_FILE.exists():
+            with open(JOURNAL_FILE, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                        if event["op"] == "add":
+                            added.setdefault(event["task"]["id"], event["task"])
+                        elif event["op"] == "done":
+                            done_at.setdefault(event["id"], event["at"])
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        continue
+    if first is None:
+        yield from select_tasks(tasks, filters, limit, offset)
+        return
+
+    # スナップショットの分とジャーナルで増えた分を、IDの大きい順に1本にする（同じIDはスナップショット優先）
+    from_snapshot = iter_index_reverse(index, first) if index else iter(())
+    from_journal = ((task_id, None, None) for task_id in sorted(added, reverse=True))
+    shown = skipped = 0
+    last_id = None
+    try:
+        for task_id, pos, size in heapq.merge(from_snapshot, from_journal,
+                                              key=lambda e: e[0], reverse=True):
+            if task_id == last_id:
+                continue
+            last_id = task_id
+            if pos is None:
+                t = dict(added[task_id])
+            else:
+                snap.seek(pos)
+                t = json.loads(snap.read(size))
+            if task_id in done_at and not t["done"]:
+                t["done"] = True
+                t["done_at"] = done_at[task_id]
+            if not match(t):
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            if limit is not None and shown >= limit:
+                break
+            yield t
+            shown += 1
+    finally:
+        for f in (snap, index):
+            if f:
+                f.close()
+
+# ーーー 常駐サーバー ーーー
+
+class TodoServer:
+    """
+    タスクをメモリに持っておく常駐サーバー。
+    id→タスクの辞書と、未完了IDの集合を持つので add / done / list をすぐ返せる。
+    変更は通常と同じジャーナルに追記するので、サーバーを止めてもデータはそのまま。
+    起動の前後などに、ほかのプロセスが直接ジャーナルへ書いたイベントも、
+    リクエストのたびに読んだ位置から先だけ読んで取りこむ。
+    """
+
+    def __init__(self):
+        self.next = 0
+        self.reload()
+        self.reserve_ids()
+
+    def reload(self):
+        """スナップショットとジャーナルを読み直し、ジャーナルのどこまで読んだかを覚える"""
+        with locked():
+            self.by_id = {t["id"]: t for t in load_tasks()}
+            try:
+                st = JOURNAL_FILE.stat()
+                self.journal = (st.st_ino, st.st_size)
+            except FileNotFoundError:
+                self.journal = (None, 0)
+        self.pending = {i for i, t in self.by_id.items() if not t["done"]}
+
+    def apply(self, event):
+        apply_event(self.by_id, event)
+        if event["op"] == "add":
+            task_id = event["task"]["id"]
+            if not self.by_id[task_id]["done"]:
+                self.pending.add(task_id)
+        elif event["op"] == "done":
+            self.pending.discard(event["id"])
+
+    def catch_up(self):
+        """ジャーナルに増えた行を取りこむ。まとめ直されて（置きかわって）いたら全部読み直す"""
+        try:
+            st = JOURNAL_FILE.stat()
+            ino, size = st.st_ino, st.st_size
+        except FileNotFoundError:
+            ino, size = None, 0
+        known_ino, pos = self.journal
+        if ino != known_ino or size < pos:
+            self.reload()
+            return
+        if size == pos:
+            return
+        with open(JOURNAL_FILE, "rb") as f:
+            f.seek(pos)
+            data = f.read(size - pos)
+        end = data.rfind(b"\n") + 1  # 書きかけの最後の行は次の回にまわす
+        for line in data[:end].splitlines():
+            try:
+                self.apply(json.loads(line))
+            except (json.JSONDecodeError, KeyError):
+                continue
+        self.journal = (ino, pos + end)
+
+    def reserve_ids(self):
+        # ほかのプロセスが直接 add してカウンターを進めていたら、その先から確保する
+        with locked():
+            self.next = max(self.next, read_counter(list(self.by_id.values())))
+            self.reserved = self.next + ID_RESERVE  # ここまではカウンターファイルに書いてある
+            write_atomic(COUNTER_FILE, str(self.reserved))
+
+    def handle(self, req):
+        self.catch_up()
+        cmd = req.get("cmd")
+        if cmd == "add":
+            if self.next >= self.reserved:
+                self.reserve_ids()
+            task = new_task(self.next, req["title"])
+            self.next += 1
+            event = {"op": "add", "task": task}
+            append_event(event)
+            self.apply(event)
+            return {"task": task}
+        if cmd == "done":
+            t = self.by_id.get(req["id"])
+            if t is None:
+                return {"status": "missing", "title": None}
+            if t["done"]:
+                return {"status": "already", "title": t["title"]}
+            event = {"op": "done", "id": t["id"], "at": now_str()}
+            append_event(event)
+            self.apply(event)
+            return {"status": "done", "title": t["title"]}
+        if cmd == "ping":
+            return {"ok": True}
+        return {"error": f"unknown command: {cmd}"}
+
+    def list_rows(self, req):
+        """list の結果を1件ずつ返す（serve が1件ごとに1行で送る）"""
+        self.catch_up()
+        filters = req.get("filters", {})
+        if filters.get("status", "pending") == "pending":
+            # 未完了だけなら、未完了IDの集合から探す
+            tasks = [self.by_id[i] for i in self.pending]
+        else:
+            tasks = list(self.by_id.values())
+        yield from select_tasks(tasks, filters, req.get("limit"), req.get("offset", 0))
+
+    def close(self):
+        # きちんと止めるときは、使っていないIDを返しておく（その後だれも進めていなければ）
+        with locked():
+            if read_counter(list(self.by_id.values())) == self.reserved:
+                write_atomic(COUNTER_FILE, str(self.next))
+
+def serve(sock_path=None):
+    """
+    Unix ドメインソケットで待ち受け、1接続につき1リクエスト（JSON 1行）を処理する。
+    返事はふつう JSON 1行。list だけは1件ごとに {"task": ...} を1行ずつ送り、最後に {"end": true} を送る。
+    """
+    sock_path = Path(sock_path or SOCKET_PATH)
+    if request(("ping",), sock_path) is not None:
+        print(f"ℹ️ すでに起動しています: {sock_path}")
+        return
+    if sock_path.exists():
+        sock_path.unlink()  # 前回の残りかす
+    # 先に待ち受けを始めてから読みこむ。読みこみ中に来たクライアントは接続待ちになり、
+    # それより前に直接書かれたイベントは catch_up() で取りこむ
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(sock_path))
+    listener.listen(64)
+    try:
+        server = TodoServer()
+    except BaseException:
+        listener.close()
+        sock_path.unlink(missing_ok=True)
+        raise
+    print(f"🚀 常駐サーバーを起動しました: {sock_path}（{len(server.by_id)} 件）")
+    try:
+        while True:
+            conn, _ = listener.accept()
+            stop = False
+            try:
+                with conn, conn.makefile("rwb") as f:
+                    # おかしなリクエストが来ても、エラーを返すだけでサーバーは止めない
+                    try:
+                        req = json.loads(f.readline())
+                        if not isinstance(req, dict):
+                            raise ValueError("request must be a JSON object")
+                        stop = req.get("cmd") == "shutdown"
+                        if req.get("cmd") == "list":
+                            for t in server.list_rows(req):
+                                f.write(json.dumps({"task": t}, ensure_ascii=False).encode("utf-8") + b"\n")
+                            resp = {"end": True}
+                        else:
+                            resp = {"ok": True} if stop else server.handle(req)
+                    except Exception as e:
+                        resp = {"error": f"{type(e).__name__}: {e}"}
+                    f.write(json.dumps(resp, ensure_ascii=False).encode("utf-8") + b"\n")
+            except OSError:
+                pass  # 返事を待たずに切れたクライアントなど
+            if stop:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        listener.close()
+        sock_path.unlink(missing_ok=True)
+        print("👋 常駐サーバーを止めました")
+
+def request(cmd, sock_path=None):
+    """
+    常駐サーバーに1つ命令を送り、返事（辞書）を返す。
+    cmd は ("add", タイトル) / ("done", ID) / ("ping",) / ("shutdown",)（list は request_list を使う）
+    サーバーが動いていなければ None。
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    name = cmd[0]
+    req = {"cmd": name}
+    if name == "add":
+        req["title"] = cmd[1]
+    elif name == "done":
+        req["id"] = cmd[1]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(str(sock_path or SOCKET_PATH))
+            s.sendall(json.dumps(req, ensure_ascii=False).encode("utf-8") + b"\n")
+            with s.makefile("rb") as f:
+                line = f.readline()
+    except OSError:
+        return None
+    resp = json.loads(line) if line else None
+    if resp and "error" in resp:
+        print(f"⚠️ 常駐サーバーでエラーが起きました: {resp['error']}", file=sys.stderr)
+        sys.exit(1)
+    return resp
+
+def request_list(filters, limit, offset, sock_path=None):
+    """
+    常駐サーバーに list を送る。サーバーが動いていなければ None、
+    動いていれば、返ってくるタスクを1行ずつ読みながら返すジェネレーターを返す。
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    req = {"cmd": "list", "filters": filters, "limit": limit, "offset": offset}
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(str(sock_path or SOCKET_PATH))
+        s.sendall(json.dumps(req, ensure_ascii=False).encode("utf-8") + b"\n")
+    except OSError:
+        s.close()
+        return None
+
+    def rows():
+        with s, s.makefile("rb") as f:
+            for line in f:
+                resp = json.loads(line)
+                if "error" in resp:
+                    print(f"⚠️ 常駐サーバーでエラーが起きました: {resp['error']}", file=sys.stderr)
+                    sys.exit(1)
+                if resp.get("end"):
+                    return
+                yield resp["task"]
+    return rows()
+
+def print_added(task):
     print(f"✅ 追加しました(ID {task['id']}): {task['title']}")
 
+def print_done(task_id, status, title):
+    if status == "already":
+        print(f"ℹ️ すでに完了済みです: ID {task_id}")
+    elif status == "done":
+        print(f"🎉 完了にしました: ID {task_id} → {title}")
+    else:
+        print(f"❓ 指定したIDが見つかりません: {task_id}")
+
+def cmd_add(args):
+    resp = request(("add", args.title))
+    print_added(resp["task"] if resp else add_task(args.title))
+
 def format_row(cols, widths):
     # 幅調整してきれいに並べる
     padded = []
@@ -65,44 +682,158 @@ def format_row(cols, widths):
         padded.append(s.ljust(width))
     return "  ".join(padded)
 
-def cmd_list(args):
-    tasks = load_tasks()
-    if not args.all:
-        tasks = [t for t in tasks if not t["done"]]
+def date_arg(s):
+    """--created-from などの日付（YYYY-MM-DD）を確かめ、0埋めした形にそろえる"""
+    try:
+        return datetime.strptime(s, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"YYYY-MM-DD の形で指定してください: {s}")
 
-    # 新しい順に表示（idの大きい順）
-    tasks = sorted(tasks, key=lambda t: t["id"], reverse=True)
+def list_filters(args):
+    """コマンドライン引数から絞りこみ条件の辞書を作る"""
+    status = args.status or ("all" if args.all else "pending")
+    filters = {"status": status, "grep": args.grep, "regex": args.regex,
+               "created_from": args.created_from, "created_to": args.created_to,
+               "done_from": args.done_from, "done_to": args.done_to}
+    return {k: v for k, v in filters.items() if v}
+
+def cmd_list(args):
+    filters = list_filters(args)
+    # サーバーが絞りこんで新しい順に1件ずつ送ってくる。いなければ索引をたどって1件ずつ読む
+    tasks = request_list(filters, args.limit, args.offset)
+    if tasks is None:
+        tasks = stream_tasks(filters, args.limit, args.offset)
+    if args.json:
+        # 1行に1タスクの JSON Lines（jq などにそのまま渡せる）
+        for t in tasks:
+            print(json.dumps(t, ensure_ascii=False))
+        return
+    print_tasks(tasks, filters["status"] == "all")
 
+def print_tasks(tasks, show_all):
     headers = ["ID", "状態", "タイトル", "作成日"]
     widths = [3, 2, 24, 16]  # 見やすい幅
 
     print(format_row(headers, widths))
+    shown = 0
     for t in tasks:
         status = "☑" if t["done"] else "☐"
         print(format_row([t["id"], status, t["title"], t["created_at"]], widths))
+        shown += 1
 
-    if not tasks:
-        if args.all:
+    if not shown:
+        if show_all:
             print("（タスクはありません）")
         else:
             print("（未完了のタスクはありません。--all で完了含む全件表示）")
 
 def cmd_done(args):
-    tasks = load_tasks()
-    for t in tasks:
-        if t["id"] == args.id:
-            if t["done"]:
-                print(f"ℹ️ すでに完了済みです: ID {args.id}")
-            else:
-                t["done"] = True
-                t["done_at"] = now_str()
-                save_tasks(tasks)
-                print(f"🎉 完了にしました: ID {args.id} → {t['title']}")
-            break
+    resp = request(("done", args.id))
+    if resp:
+        print_done(args.id, resp["status"], resp["title"])
     else:
-        print(f"❓ 指定したIDが見つかりません: {args.id}")
+        print_done(args.id, *done_task(args.id))
+
+def cmd_serve(args):
+    if not hasattr(socket, "AF_UNIX"):
+        print("⚠️ この環境では常駐サーバーを使えません（Unix ドメインソケット非対応）")
+        return
+    if args.stop:
+        print("👋 停止を依頼しました" if request(("shutdown",)) else "ℹ️ 常駐サーバーは動いていません")
+        return
+    serve()
+
+def run_bench(count, processes=0):
+    """
+    一時フォルダで count 件の add を、直接ファイルに書く場合とサーバー経由の場合で比べる。
+    processes > 0 なら、実際に python todo.py add を起動する場合も測る（起動の重さ込み）。
+    """
+    import subprocess
+    import threading
+
+    global DATA_FILE, JOURNAL_FILE, COUNTER_FILE, INDEX_FILE, LOCK_FILE, SOCKET_PATH
+    saved = DATA_FILE, JOURNAL_FILE, COUNTER_FILE, INDEX_FILE, LOCK_FILE, SOCKET_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        home = Path(tmp)
+
+        def use(sub):
+            global DATA_FILE, JOURNAL_FILE, COUNTER_FILE, INDEX_FILE, LOCK_FILE, SOCKET_PATH
+            (home / sub).mkdir()
+            DATA_FILE = home / sub / ".todo_cli.json"
+            JOURNAL_FILE = home / sub / ".todo_cli.journal.jsonl"
+            COUNTER_FILE = home / sub / ".todo_cli.next_id"
+            INDEX_FILE = home / sub / ".todo_cli.json.idx"
+            LOCK_FILE = home / sub / ".todo_cli.lock"
+            SOCKET_PATH = home / sub / ".todo_cli.sock"
+
+        try:
+            use("direct")
+            started = time.perf_counter()
+            for i in range(count):
+                add_task(f"task {i}")
+            direct = time.perf_counter() - started
+
+            use("daemon")
+            thread = threading.Thread(target=serve, daemon=True)
+            thread.start()
+            while request(("ping",)) is None:
+                time.sleep(0.01)
+            started = time.perf_counter()
+            for i in range(count):
+                request(("add", f"task {i}"))
+            daemon = time.perf_counter() - started
+            request(("shutdown",))
+            thread.join()
+        finally:
+            DATA_FILE, JOURNAL_FILE, COUNTER_FILE, INDEX_FILE, LOCK_FILE, SOCKET_PATH = saved
+
+        print(f"[bench] 直接ファイル: {count} 件 {direct:.2f} 秒（{count / direct:,.0f} 件/秒）")
+        print(f"[bench] 常駐サーバー: {count} 件 {daemon:.2f} 秒（{count / daemon:,.0f} 件/秒）")
+
+        if processes:
+            env = dict(os.environ, HOME=str(home / "proc"), USERPROFILE=str(home / "proc"))
+            (home / "proc").mkdir()
+            cmd = [sys.executable, os.path.abspath(__file__), "add"]
+            started = time.perf_counter()
+            for i in range(processes):
+                subprocess.run(cmd + [f"task {i}"], env=env, stdout=subprocess.DEVNULL, check=True)
+            cold = time.perf_counter() - started
+            server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve"],
+                                      env=env, stdout=subprocess.DEVNULL)
+            while not (home / "proc" / ".todo_cli.sock").exists():
+                time.sleep(0.01)
+            started = time.perf_counter()
+            for i in range(processes):
+                subprocess.run(cmd + [f"task {i}"], env=env, stdout=subprocess.DEVNULL, check=True)
+            warm = time.perf_counter() - started
+            subprocess.run([sys.executable, os.path.abspath(__file__), "serve", "--stop"],
+                           env=env, stdout=subprocess.DEVNULL)
+            server.wait()
+            print(f"[bench] プロセス起動（直接）: {processes} 回 {cold:.2f} 秒")
+            print(f"[bench] プロセス起動（サーバー経由）: {processes} 回 {warm:.2f} 秒")
+
+def cmd_bench(args):
+    run_bench(args.count, args.processes)
+
+def cmd_compact(args):
+    count = compact()
+    print(f"🧹 {count} 件のタスクをまとめ直しました: {DATA_FILE}")
 
 def main():
+    # 常駐サーバーが動いていれば、argparse の準備もせずにそのまま転送する
+    argv = sys.argv[1:]
+    resp = None
+    if len(argv) == 2 and argv[0] == "add" and not argv[1].startswith("-"):
+        resp = request(("add", argv[1]))
+        if resp:
+            print_added(resp["task"])
+    elif len(argv) == 2 and argv[0] == "done" and argv[1].isascii() and argv[1].isdecimal():
+        resp = request(("done", int(argv[1])))
+        if resp:
+            print_done(int(argv[1]), resp["status"], resp["title"])
+    if resp:
+        return
+
     parser = argparse.ArgumentParser(
         description="シンプルTODO CLI（add/list/done）"
     )
@@ -116,6 +847,17 @@ def main():
     # list
     p_list = sub.add_parser("list", help="タスクを一覧表示します")
     p_list.add_argument("--all", action="store_true", help="完了済みも含めて表示します")
+    p_list.add_argument("--status", choices=["pending", "done", "all"],
+                        help="状態で絞りこみます（既定: pending。--all は all と同じ）")
+    p_list.add_argument("--grep", help="タイトルに含まれる文字で絞りこみます")
+    p_list.add_argument("--regex", help="タイトルを正規表現で絞りこみます")
+    p_list.add_argument("--created-from", type=date_arg, metavar="YYYY-MM-DD", help="作成日がこの日以降")
+    p_list.add_argument("--created-to", type=date_arg, metavar="YYYY-MM-DD", help="作成日がこの日以前")
+    p_list.add_argument("--done-from", type=date_arg, metavar="YYYY-MM-DD", help="完了日がこの日以降")
+    p_list.add_argument("--done-to", type=date_arg, metavar="YYYY-MM-DD", help="完了日がこの日以前")
+    p_list.add_argument("--limit", type=int, help="表示する件数（新しい順）")
+    p_list.add_argument("--offset", type=int, default=0, help="先頭からとばす件数")
+    p_list.add_argument("--json", action="store_true", help="1行に1タスクの JSON で出力します")
     p_list.set_defaults(func=cmd_list)
 
     # done
@@ -123,7 +865,29 @@ def main():
     p_done.add_argument("id", type=int, help="完了にしたいタスクID")
     p_done.set_defaults(func=cmd_done)
 
+    # compact
+    p_compact = sub.add_parser("compact", help="変更記録をまとめてデータファイルを整理します")
+    p_compact.set_defaults(func=cmd_compact)
+
+    # serve
+    p_serve = sub.add_parser("serve", help="常駐サーバーを起動します（Unix系のみ）")
+    p_serve.add_argument("--stop", action="store_true", help="動いている常駐サーバーを止めます")
+    p_serve.set_defaults(func=cmd_serve)
+
+    # bench
+    p_bench = sub.add_parser("bench", help="常駐サーバーあり/なしで add の速さを比べます")
+    p_bench.add_argument("--count", type=int, default=10000, help="連続で add する件数")
+    p_bench.add_argument("--processes", type=int, default=0,
+                         help="実際にプロセスを起動して測る回数（0 なら測らない）")
+    p_bench.set_defaults(func=cmd_bench)
+
     args = parser.parse_args()
+    if args.command == "list" and args.regex:
+        # 正規表現はサーバーに送る前にここで確かめる
+        try:
+            re.compile(args.regex)
+        except re.error as e:
+            parser.error(f"--regex の正規表現が正しくありません: {e}")
     args.func(args)
 
 if __name__ == "__main__":
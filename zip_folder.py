@@ -1,10 +1,22 @@
 # zip_folder.py
 import argparse
+import json
+import math
 import os
+import random
+import re
+import shutil
+import socket
+import struct
 import sys
+import tempfile
 import time
 import zipfile
-from fnmatch import fnmatch
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatch, translate
+from functools import lru_cache
 
 DEFAULT_EXCLUDES = ["__pycache__", ".DS_Store", ".git", "*.tmp", "*.log"]
 
@@ -20,43 +32,596 @@ def make_unique(path_without_ext):
         candidate = f"{path_without_ext}({n})"
     return candidate + ".zip"
 
-def should_exclude(name, exclude_patterns):
-    """ファイル/フォルダ名が除外パターンに当てはまるか判定"""
-    return any(fnmatch(name, pat) for pat in exclude_patterns)
+def compile_excludes(exclude_patterns):
+    """除外パターンをまとめて1つの正規表現にする（名前ごとに fnmatch を何回も呼ばないため）"""
+    if not exclude_patterns:
+        return lambda name: None
+    return re.compile("|".join(translate(os.path.normcase(pat)) for pat in exclude_patterns)).match
 
-def zip_directory(src_dir, out_name=None, exclude_patterns=None, quiet=False):
+def should_exclude(name, matcher):
+    """ファイル/フォルダ名が除外パターン（compile_excludes で作ったもの）に当てはまるか判定"""
+    return matcher(os.path.normcase(name)) is not None
+
+# ーーー 圧縮ポリシー ーーー
+
+# すでに圧縮されている形式。deflate してもほぼ縮まないので無圧縮で格納する
+STORED_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".heic", ".avif",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".7z", ".rar", ".jar", ".whl",
+    ".mp3", ".m4a", ".aac", ".ogg", ".flac", ".mp4", ".m4v", ".mov", ".mkv", ".webm", ".avi",
+    ".docx", ".xlsx", ".pptx", ".odt", ".epub", ".woff", ".woff2",
+}
+ENTROPY_SAMPLE = 64 * 1024   # 先頭のこのバイト数だけ見てエントロピーを測る
+ENTROPY_MIN_SIZE = 4096      # これより小さいファイルは測っても当てにならないので測らない
+ENTROPY_THRESHOLD = 7.5      # 1バイトあたりのビット数。これを超えたら圧縮ずみとみなす
+
+def byte_entropy(data):
+    """バイト分布のエントロピー（0〜8 ビット/バイト）"""
+    n = len(data)
+    if not n:
+        return 0.0
+    return -sum(c / n * math.log2(c / n) for c in Counter(data).values())
+
+def sample_entropy(path):
+    """ファイル先頭 ENTROPY_SAMPLE バイトのエントロピー"""
+    with open(path, "rb") as f:
+        return byte_entropy(f.read(ENTROPY_SAMPLE))
+
+def parse_level_rule(text):
+    """--level の 'パターン=レベル'（レベルは 0〜9、0 は無圧縮）を読む"""
+    pattern, sep, level = text.rpartition("=")
+    if not sep or not pattern or not level.isdigit() or int(level) > 9:
+        raise argparse.ArgumentTypeError(f"'パターン=0〜9' の形で指定してください: {text}")
+    return pattern, int(level)
+
+class CompressionPolicy:
+    """
+    ファイルごとの圧縮レベルを決める。0 は ZIP_STORED（無圧縮）。
+    1. --level のパターン（アーカイブ内のパスに対して、先に書いたものが優先）
+    2. adaptive なら、圧縮ずみの拡張子と、先頭ブロックのエントロピーが高いものは無圧縮
+    3. それ以外は default_level で deflate
+    """
+
+    def __init__(self, level_rules=(), default_level=zlib.Z_DEFAULT_COMPRESSION, adaptive=True):
+        self.rules = [(re.compile(translate(os.path.normcase(pat))).match, level)
+                      for pat, level in level_rules]
+        self.default_level = default_level
+        self.adaptive = adaptive
+        self.stats = Counter()  # 無圧縮にした理由ごとの件数
+
+    def level_for(self, abs_path, arcname, size, sample=True):
+        """
+        sample=False なら先頭ブロックを読まず、エントロピーで決める必要があるときは None を返す
+        （並列圧縮では、読んだデータを使ってワーカーが決める）。
+        """
+        name = os.path.normcase(arcname.replace(os.sep, "/"))
+        for match, level in self.rules:
+            if match(name):
+                if level == 0:
+                    self.stats["パターン"] += 1
+                return level
+        if self.adaptive:
+            if os.path.splitext(name)[1] in STORED_EXTENSIONS:
+                self.stats["拡張子"] += 1
+                return 0
+            if size >= ENTROPY_MIN_SIZE and not sample:
+                return None
+            if size >= ENTROPY_MIN_SIZE and sample_entropy(abs_path) > ENTROPY_THRESHOLD:
+                self.stats["エントロピー"] += 1
+                return 0
+        return self.default_level
+
+# ーーー 並列圧縮（--jobs）ーーー
+
+UNIT_SIZE = 8 * 1024 * 1024    # 大きなファイルはこの大きさごとに別々に圧縮する
+TASK_BYTES = 8 * 1024 * 1024   # 小さなファイルはこの大きさまで1タスクにまとめる
+TASK_FILES = 64                # 1タスクにまとめる最大の単位数
+ZIP64_LIMIT = (1 << 31) - 1    # zipfile と同じく、これを超えたら ZIP64 の拡張を使う
+CHUNK_SIZE = 1024 * 1024       # 1プロセスで圧縮するときに一度に読む大きさ
+PROGRESS_INTERVAL = 0.5        # 進み具合を表示する間隔（秒）
+
+def _gf2_times(mat, vec):
+    total = 0
+    i = 0
+    while vec:
+        if vec & 1:
+            total ^= mat[i]
+        vec >>= 1
+        i += 1
+    return total
+
+def _gf2_square(mat):
+    return [_gf2_times(mat, mat[n]) for n in range(32)]
+
+@lru_cache(maxsize=4)
+def _crc32_shift_operator(length):
+    """
+    CRC を length バイトぶん先へ進める操作を、32行の GF(2) 行列（基底ごとの行き先）にしたもの。
+    作るのに数ミリ秒かかるので、UNIT_SIZE のぶんは一度だけ作って使い回す。
+    """
+    result = [1 << n for n in range(32)]  # 単位行列
+    odd = [0xEDB88320] + [1 << n for n in range(31)]
+    even = _gf2_square(odd)
+    odd = _gf2_square(even)
+    while True:
+        even = _gf2_square(odd)
+        if length & 1:
+            result = [_gf2_times(even, r) for r in result]
+        length >>= 1
+        if not length:
+            break
+        odd = _gf2_square(even)
+        if length & 1:
+            result = [_gf2_times(odd, r) for r in result]
+        length >>= 1
+        if not length:
+            break
+    return tuple(result)
+
+def crc32_combine(crc1, crc2, len2):
+    """
+    crc32(A) と crc32(B) と len(B) から crc32(A + B) を求める（zlib の crc32_combine と同じ計算）。
+    分けて圧縮したかたまりの CRC を、データを読み直さずにつなげるのに使う。
+    ほとんどのかたまりは UNIT_SIZE なので、その長さは作っておいた行列を1回かけるだけですむ。
+    最後の半端なかたまりだけ、その場で計算する。
+    """
+    if len2 == 0:
+        return crc1
+    if len2 == UNIT_SIZE:
+        return _gf2_times(_crc32_shift_operator(UNIT_SIZE), crc1) ^ crc2
+    odd = [0xEDB88320] + [1 << n for n in range(31)]
+    even = _gf2_square(odd)
+    odd = _gf2_square(even)
+    while True:
+        even = _gf2_square(odd)
+        if len2 & 1:
+            crc1 = _gf2_times(even, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+        odd = _gf2_square(even)
+        if len2 & 1:
+            crc1 = _gf2_times(odd, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+    return crc1 ^ crc2
+
+def deflate_units(units, default_level=zlib.Z_DEFAULT_COMPRESSION):
+    """
+    (パス, 開始位置, 長さ, 最後かどうか, 圧縮レベル) の並びを圧縮する（ワーカープロセスで動く）。
+    レベル 0 の単位は無圧縮で格納するので、読んだデータをそのまま返す。
+    レベルが None の単位（1単位に収まるファイル全体）は、読んだ先頭のエントロピーが高ければ無圧縮、
+    そうでなければ default_level で圧縮する。
+    途中のかたまりは Z_FULL_FLUSH で終えるので、かたまりの圧縮結果をそのままつなげても
+    1本の正しい deflate データになる。戻り値は [(crc32, 圧縮データ, 使ったレベル), ...]
+    """
+    results = []
+    for path, offset, length, last, level in units:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        if level is None:
+            level = 0 if byte_entropy(data[:ENTROPY_SAMPLE]) > ENTROPY_THRESHOLD else default_level
+        if level == 0:
+            results.append((zlib.crc32(data), data, level))
+            continue
+        comp = zlib.compressobj(level, zlib.DEFLATED, -15)
+        out = comp.compress(data) + comp.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH)
+        results.append((zlib.crc32(data), out, level))
+    return results
+
+class ZipWriter:
+    """
+    圧縮ずみのデータを受け取って ZIP を組み立てる小さな書き出し器。
+    メンバーごとに begin → write（何回でも）→ end を呼び、最後に close する。
+    ふだんはローカルヘッダーの CRC とサイズを end でシークして書き直す。
+    streaming=True（パイプやソケット向け）のときはシークせず、
+    データのあとにデータディスクリプタ（フラグのビット3）として書く。
+    """
+
+    def __init__(self, f, streaming=False):
+        self.f = f
+        self.streaming = streaming
+        self.pos = 0
+        self.entries = []
+        self.current = None
+
+    def _write(self, data):
+        self.f.write(data)
+        self.pos += len(data)
+
+    def begin(self, zinfo, method, size_hint):
+        name = zinfo.filename.encode("utf-8")
+        flags = 0x800 if not zinfo.filename.isascii() else 0  # UTF-8 の名前
+        if self.streaming:
+            flags |= 0x08  # CRC とサイズはデータディスクリプタに書く
+        zip64 = size_hint * 1.05 > ZIP64_LIMIT
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0) if zip64 else b""
+        dostime = (zinfo.date_time[3] << 11) | (zinfo.date_time[4] << 5) | (zinfo.date_time[5] // 2)
+        dosdate = ((zinfo.date_time[0] - 1980) << 9) | (zinfo.date_time[1] << 5) | zinfo.date_time[2]
+        self.current = {
+            "zinfo": zinfo, "name": name, "flags": flags, "method": method, "zip64": zip64,
+            "time": dostime, "date": dosdate, "offset": self.pos,
+        }
+        self._write(struct.pack("<IHHHHHIIIHH", 0x04034B50, 45 if zip64 else 20, flags, method,
+                                dostime, dosdate, 0, 0xFFFFFFFF if zip64 else 0,
+                                0xFFFFFFFF if zip64 else 0, len(name), len(extra)) + name + extra)
+
+    def write(self, data):
+        self._write(data)
+
+    def end(self, crc, compress_size, file_size):
+        e = self.current
+        e.update(crc=crc, compress_size=compress_size, file_size=file_size)
+        if not e["zip64"] and (compress_size > ZIP64_LIMIT or file_size > ZIP64_LIMIT):
+            raise zipfile.LargeZipFile(f"サイズの見積もりを超えました: {e['zinfo'].filename}")
+        if self.streaming:
+            fmt = "<IIQQ" if e["zip64"] else "<IIII"
+            self._write(struct.pack(fmt, 0x08074B50, crc, compress_size, file_size))
+            self.entries.append(e)
+            self.current = None
+            return
+        # ローカルヘッダーの CRC / サイズを書き直す
+        self.f.seek(e["offset"] + 14)
+        if e["zip64"]:
+            self.f.write(struct.pack("<I", crc))
+            self.f.seek(e["offset"] + 30 + len(e["name"]) + 4)
+            self.f.write(struct.pack("<QQ", file_size, compress_size))
+        else:
+            self.f.write(struct.pack("<III", crc, compress_size, file_size))
+        self.f.seek(self.pos)
+        self.entries.append(e)
+        self.current = None
+
+    def close(self):
+        cd_offset = self.pos
+        for e in self.entries:
+            fields = []
+            usize, csize, offset = e["file_size"], e["compress_size"], e["offset"]
+            if usize > ZIP64_LIMIT:
+                fields.append(usize)
+                usize = 0xFFFFFFFF
+            if csize > ZIP64_LIMIT:
+                fields.append(csize)
+                csize = 0xFFFFFFFF
+            if offset > ZIP64_LIMIT:
+                fields.append(offset)
+                offset = 0xFFFFFFFF
+            extra = struct.pack(f"<HH{len(fields)}Q", 0x0001, 8 * len(fields), *fields) if fields else b""
+            version = 45 if fields or e["zip64"] else 20
+            self._write(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | version, version,
+                                    e["flags"], e["method"], e["time"], e["date"], e["crc"],
+                                    csize, usize, len(e["name"]), len(extra), 0, 0, 0,
+                                    e["zinfo"].external_attr, offset) + e["name"] + extra)
+        cd_size = self.pos - cd_offset
+        count = len(self.entries)
+        if count > 0xFFFF or cd_offset > ZIP64_LIMIT or cd_size > ZIP64_LIMIT:
+            zip64_end = self.pos
+            self._write(struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0,
+                                    count, count, cd_size, cd_offset))
+            self._write(struct.pack("<IIQI", 0x07064B50, 0, zip64_end, 1))
+            count = min(count, 0xFFFF)
+            cd_size = min(cd_size, 0xFFFFFFFF)
+            cd_offset = min(cd_offset, 0xFFFFFFFF)
+        self._write(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count, count,
+                                cd_size, cd_offset, 0))
+
+def iter_tasks(files):
+    """
+    (絶対パス, アーカイブ内の名前, サイズ, 圧縮レベル) の並びを、圧縮タスク（単位のリスト）に分ける。
+    files は順に読むだけなので、ジェネレーターでもよい。
+    大きなファイルは UNIT_SIZE ごとの単位に、小さなファイルはいくつかまとめて1タスクにする。
+    """
+    task, task_bytes = [], 0
+    for abs_path, _, size, level in files:
+        offset = 0
+        while True:
+            length = min(UNIT_SIZE, size - offset)
+            last = offset + length >= size
+            task.append((abs_path, offset, length, last, level))
+            task_bytes += length
+            if task_bytes >= TASK_BYTES or len(task) >= TASK_FILES:
+                yield task
+                task, task_bytes = [], 0
+            offset += length
+            if last:
+                break
+    if task:
+        yield task
+
+def write_serial(writer, files, progress=None):
+    """
+    files を1プロセスで CHUNK_SIZE ずつ読みながら圧縮して writer へ書く。
+    何GBのファイルでも、使うメモリは CHUNK_SIZE 程度で変わらない。
+    """
+    for abs_path, arcname, size, level in files:
+        zinfo = zipfile.ZipInfo.from_file(abs_path, arcname)
+        writer.begin(zinfo, zipfile.ZIP_STORED if level == 0 else zipfile.ZIP_DEFLATED, size)
+        comp = zlib.compressobj(level, zlib.DEFLATED, -15) if level != 0 else None
+        crc = compress_size = file_size = 0
+        with open(abs_path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                crc = zlib.crc32(data, crc)
+                file_size += len(data)
+                out = comp.compress(data) if comp else data
+                writer.write(out)
+                compress_size += len(out)
+                if progress:
+                    progress(len(data))
+        if comp:
+            out = comp.flush()
+            writer.write(out)
+            compress_size += len(out)
+        writer.end(crc, compress_size, file_size)
+        if progress:
+            progress(0, file_done=True)
+    writer.close()
+    return {e["zinfo"].filename: e["crc"] for e in writer.entries}
+
+def write_parallel(writer, files, jobs, progress=None, policy=None):
+    """
+    files をワーカープロセスで圧縮し、メインプロセスが順番どおりに writer へ書きこむ。
+    files はタスクを出すのに合わせて少しずつ読むので、ジェネレーターのままでよい。
+    圧縮レベルが None のファイルはワーカーがエントロピーで決め、policy.stats に数える。
+    """
+    default_level = policy.default_level if policy else zlib.Z_DEFAULT_COMPRESSION
+    queued = deque()  # タスクに出したが、まだ書き始めていないファイル
+    current = None  # (ZipInfo, 残りバイト数, crc, 圧縮後サイズ)
+
+    def feed():
+        for member in files:
+            queued.append(member)
+            yield member
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = deque()
+
+        def consume(results):
+            nonlocal current
+            for crc, data, used_level in results:
+                if current is None:
+                    abs_path, arcname, size, level = queued.popleft()
+                    if level is None and used_level == 0 and policy:
+                        policy.stats["エントロピー"] += 1
+                    zinfo = zipfile.ZipInfo.from_file(abs_path, arcname)
+                    writer.begin(zinfo, zipfile.ZIP_STORED if used_level == 0 else zipfile.ZIP_DEFLATED, size)
+                    current = [zinfo, size, 0, 0, 0]
+                zinfo, size, done, run_crc, csize = current
+                length = min(UNIT_SIZE, size - done)
+                writer.write(data)
+                current = [zinfo, size, done + length,
+                           crc32_combine(run_crc, crc, length) if done else crc, csize + len(data)]
+                if progress:
+                    progress(length)
+                if current[2] >= size:
+                    writer.end(current[3], current[4], size)
+                    current = None
+                    if progress:
+                        progress(0, file_done=True)
+
+        for task in iter_tasks(feed()):
+            pending.append(pool.submit(deflate_units, task, default_level))
+            if len(pending) >= jobs * 2:
+                consume(pending.popleft().result())
+        while pending:
+            consume(pending.popleft().result())
+        writer.close()
+    return {e["zinfo"].filename: e["crc"] for e in writer.entries}
+
+# ーーー 差分アーカイブ（--incremental / restore）ーーー
+
+MANIFEST_SUFFIX = ".manifest.json"  # アーカイブの横に置く目録（例: foo.zip.manifest.json）
+
+def load_manifest(zip_path):
+    with open(zip_path + MANIFEST_SUFFIX, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(zip_path, manifest):
+    tmp = zip_path + MANIFEST_SUFFIX + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, zip_path + MANIFEST_SUFFIX)
+
+def find_latest_archive(out_dir, src_dir):
+    """out_dir の中から、同じフォルダを圧縮したいちばん新しいアーカイブと目録を探す"""
+    latest = None
+    for entry in os.scandir(out_dir):
+        if not entry.name.endswith(".zip" + MANIFEST_SUFFIX):
+            continue
+        zip_path = entry.path[:-len(MANIFEST_SUFFIX)]
+        try:
+            manifest = load_manifest(zip_path)
+        except (OSError, ValueError):
+            continue
+        if manifest.get("source") != src_dir or not os.path.exists(zip_path):
+            continue
+        if latest is None or manifest["created"] > latest[1]["created"]:
+            latest = (zip_path, manifest)
+    return latest
+
+def file_crc(path):
+    crc = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(1024 * 1024)
+            if not block:
+                return crc
+            crc = zlib.crc32(block, crc)
+
+def plan_delta(files, previous):
+    """
+    前回の目録 previous と比べて、圧縮しなおすファイル・そのまま使えるファイル・消えたファイルに分ける。
+    サイズと更新時刻が同じならそのまま。時刻だけ変わったものは CRC を計算して中身を確かめる。
+    """
+    changed, kept = [], {}
+    for item in files:
+        _, arcname, size, mtime = item
+        key = arcname.replace(os.sep, "/")
+        old = previous.get(key)
+        if old and old[0] == size and old[1] == mtime:
+            kept[key] = old
+        elif old and old[0] == size and file_crc(item[0]) == old[2]:
+            kept[key] = [size, mtime, old[2]]
+        else:
+            changed.append(item)
+    current = kept.keys() | {arcname.replace(os.sep, "/") for _, arcname, _, _ in changed}
+    deleted = sorted(previous.keys() - current)
+    return changed, kept, deleted
+
+def restore_archive(zip_path, dest_dir, quiet=False):
+    """
+    差分アーカイブ zip_path から親をたどって、その時点のフォルダを dest_dir に作りなおす。
+    ファイルごとに最後に追加されたアーカイブからだけ取り出すので、同じファイルを何度も書かない。
+    """
+    chain = []
+    path = os.path.abspath(zip_path)
+    while path:
+        manifest = load_manifest(path)
+        chain.append((path, manifest))
+        path = os.path.join(os.path.dirname(path), manifest["parent"]) if manifest["parent"] else None
+
+    final = chain[0][1]["files"]
+    owner = {}
+    for path, manifest in chain:  # 新しい順
+        for name in manifest["added"]:
+            if name in final and name not in owner:
+                owner[name] = path
+    missing = final.keys() - owner.keys()
+    if missing:
+        raise FileNotFoundError(f"どのアーカイブにも入っていないファイルがあります: {sorted(missing)[0]}")
+
+    restored = 0
+    for path, _ in reversed(chain):
+        names = [name for name, p in owner.items() if p == path]
+        if not names:
+            continue
+        with zipfile.ZipFile(path) as zf:
+            for name in names:
+                out = zf.extract(name, dest_dir)
+                mtime = final[name][1]
+                os.utime(out, ns=(mtime, mtime))
+                restored += 1
+        if not quiet:
+            print(f"展開: {os.path.basename(path)}  ({len(names)} ファイル)")
+    if not quiet:
+        print(f"\n✅ 復元完了: {dest_dir}  ({restored} ファイル, アーカイブ {len(chain)} 個)")
+    return restored
+
+def zip_directory(src_dir, out_name=None, exclude_patterns=None, quiet=False, jobs=1,
+                  incremental=False, policy=None, out_dir=None, stream=None):
+    """
+    src_dir を ZIP にする。ふつうは out_dir（省略時はカレント）にファイルを作ってそのパスを返す。
+    stream（書きこみ用のバイナリ出力）を渡すと、一時ファイルを作らずそこへ流しこみ、None を返す。
+    """
     if not os.path.isdir(src_dir):
         raise FileNotFoundError(f"フォルダが見つかりません: {src_dir}")
+    if stream is not None and incremental:
+        raise ValueError("--incremental はファイルへの出力でしか使えません")
 
-    exclude_patterns = (exclude_patterns or []) + DEFAULT_EXCLUDES
+    excluded = compile_excludes((exclude_patterns or []) + DEFAULT_EXCLUDES)
+    policy = policy or CompressionPolicy()
+    out_dir = out_dir or os.getcwd()
+    # ZIP を標準出力に流すときは、メッセージを標準エラーへ
+    log = print if stream is None else (lambda *a, **k: print(*a, file=sys.stderr, **k))
 
     # 出力ファイル名（拡張子除く）を決める
     src_dir = os.path.abspath(src_dir)
     base = out_name or (os.path.basename(src_dir) + "_" + timestamp())
-    out_path_without_ext = os.path.join(os.getcwd(), base)
+    out_path_without_ext = os.path.join(out_dir, base)
 
     # 同名があれば連番で回避
-    zip_path = make_unique(out_path_without_ext)
+    zip_path = make_unique(out_path_without_ext) if stream is None else None
 
-    files_added = 0
-    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+    def walk_files():
         for root, dirs, files in os.walk(src_dir):
             # 除外フォルダをスキップ
-            dirs[:] = [d for d in dirs if not should_exclude(d, exclude_patterns)]
-            # ファイルを追加
+            dirs[:] = [d for d in dirs if not should_exclude(d, excluded)]
             for f in files:
-                if should_exclude(f, exclude_patterns):
+                if should_exclude(f, excluded):
                     continue
                 abs_path = os.path.join(root, f)
-                arcname = os.path.relpath(abs_path, start=src_dir)
-                zf.write(abs_path, arcname)
-                files_added += 1
-                if not quiet and files_added % 25 == 0:
-                    print(f"追加中... {files_added} ファイル")
+                st = os.stat(abs_path)
+                yield abs_path, os.path.relpath(abs_path, start=src_dir), st.st_size, st.st_mtime_ns
+
+    started = time.perf_counter()
+    files = list(walk_files())  # 先に全体の大きさを数えて、残り時間の見積もりに使う
+    previous = find_latest_archive(out_dir, src_dir) if incremental else None
+    kept, deleted = {}, []
+    if previous:
+        files, kept, deleted = plan_delta(files, previous[1]["files"])
+        if not files and not deleted:
+            if not quiet:
+                log(f"変更はありません（前回: {previous[0]}）")
+            return previous[0]
 
-    size_mb = os.path.getsize(zip_path) / (1024 * 1024)
+    total = sum(size for _, _, size, _ in files)
+    files_added = 0
+    bytes_in = 0
+    last_report = started
+
+    def progress(nbytes, file_done=False):
+        nonlocal files_added, bytes_in, last_report
+        bytes_in += nbytes
+        files_added += file_done
+        now = time.perf_counter()
+        if quiet or now - last_report < PROGRESS_INTERVAL:
+            return
+        last_report = now
+        rate = bytes_in / (now - started)
+        eta = (total - bytes_in) / rate if rate > 0 else 0
+        log(f"追加中... {bytes_in / max(total, 1) * 100:5.1f}%  "
+            f"{bytes_in / (1024 * 1024):.1f}/{total / (1024 * 1024):.1f} MB  "
+            f"{rate / (1024 * 1024):.1f} MB/s  残り約 {eta:.0f} 秒  ({files_added}/{len(files)} ファイル)")
+
+    # 並列のときは、1単位に収まるファイルのエントロピー判定をワーカーに任せる（sample=False）
+    members = ((abs_path, arcname, size,
+                policy.level_for(abs_path, arcname, size, sample=jobs <= 1 or size > UNIT_SIZE))
+               for abs_path, arcname, size, _ in files)
+    out = open(zip_path, "wb") if stream is None else stream
+    try:
+        writer = ZipWriter(out, streaming=stream is not None)
+        if jobs > 1:
+            crcs = write_parallel(writer, members, jobs, progress=progress, policy=policy)
+        else:
+            crcs = write_serial(writer, members, progress=progress)
+        out.flush()
+    finally:
+        if stream is None:
+            out.close()
+
+    if incremental:
+        manifest_files = dict(kept)
+        for _, arcname, size, mtime in files:
+            key = arcname.replace(os.sep, "/")
+            manifest_files[key] = [size, mtime, crcs[key]]
+        save_manifest(zip_path, {
+            "source": src_dir,
+            "created": time.time(),
+            "parent": os.path.basename(previous[0]) if previous else None,
+            "files": manifest_files,
+            "added": sorted(manifest_files.keys() - kept.keys()),
+            "deleted": deleted,
+        })
+
+    elapsed = time.perf_counter() - started
+    size_mb = writer.pos / (1024 * 1024)
     if not quiet:
-        print(f"\n✅ 完了: {zip_path}  ({files_added}ファイル, {size_mb:.2f} MB)")
+        rate = bytes_in / (1024 * 1024) / elapsed if elapsed > 0 else 0
+        kind = "差分" if previous else "完了"
+        log(f"\n✅ {kind}: {zip_path or 'ストリーム出力'}  ({files_added}ファイル, {size_mb:.2f} MB)")
+        log(f"   {elapsed:.2f} 秒 / 入力 {rate:.1f} MB/s（jobs={jobs}）")
+        if policy.stats:
+            reasons = ", ".join(f"{k} {v}" for k, v in policy.stats.items())
+            log(f"   無圧縮で格納: {sum(policy.stats.values())} ファイル（{reasons}）")
+        if previous:
+            skipped = sum(v[0] for v in kept.values())
+            log(f"   圧縮 {bytes_in / (1024 * 1024):.2f} MB / スキップ {skipped / (1024 * 1024):.2f} MB"
+                f"（変更なし {len(kept)} ファイル, 削除 {len(deleted)} ファイル）")
+            log(f"   元のアーカイブ: {previous[0]}")
     return zip_path
 
 def parse_args():
@@ -70,14 +635,138 @@ def parse_args():
         help=f"除外パターン（スペース区切りで複数OK）。例: --exclude '*.png' 'node_modules'"
     )
     parser.add_argument("-q", "--quiet", action="store_true", help="進行状況を表示しない")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="圧縮に使うプロセス数（2以上で並列圧縮）")
+    parser.add_argument("--incremental", action="store_true",
+                        help="前回のアーカイブから変わったファイルだけを入れた差分ZIPを作る（目録 .manifest.json も保存）")
+    parser.add_argument("--level", action="append", type=parse_level_rule, default=[], metavar="PATTERN=LEVEL",
+                        help="パターンごとの圧縮レベル（0〜9、0 は無圧縮）。例: --level '*.txt=9' --level 'raw/*=0'")
+    parser.add_argument("--no-adaptive", action="store_true",
+                        help="圧縮ずみの拡張子や中身の判定をやめて、すべて deflate する")
+    dest = parser.add_mutually_exclusive_group()
+    dest.add_argument("--stdout", action="store_true",
+                      help="ZIP をファイルにせず標準出力へ流す（例: ... --stdout | ssh host 'cat > a.zip'）")
+    dest.add_argument("--send", metavar="[HOST:]PORT",
+                      help="ZIP をソケットへ流す（HOST を省くと 127.0.0.1）")
     return parser.parse_args()
 
+def open_socket_stream(address):
+    """'[HOST:]PORT' に接続して、書きこみ用のファイルオブジェクトを返す"""
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"ポート番号が正しくありません: {address}")
+    sock = socket.create_connection((host or "127.0.0.1", int(port)))
+    return sock, sock.makefile("wb")
+
+def make_mixed_tree(root):
+    """ベンチマーク用に、テキスト・画像・乱数データ・除外対象がまざったフォルダを作る"""
+    rnd = random.Random(0)
+    text = "def hello(name):\n    return f'こんにちは {name}'\n\n".encode("utf-8") * 500
+    table = "".join(f"{i},{rnd.randint(0, 9999)},item{i % 37}\n" for i in range(5000)).encode()
+    layout = [
+        ("src", "mod{}.py", 200, lambda: text),
+        ("data", "table{}.csv", 40, lambda: table),
+        ("img", "photo{}.png", 40, lambda: rnd.randbytes(256 * 1024)),
+        ("blob", "chunk{}.bin", 20, lambda: rnd.randbytes(256 * 1024)),  # 拡張子では分からない圧縮ずみデータ
+        ("src/__pycache__", "mod{}.pyc", 50, lambda: text[:2000]),
+        ("logs", "run{}.log", 50, lambda: text[:2000]),
+    ]
+    for sub, pattern, count, make in layout:
+        os.makedirs(os.path.join(root, sub), exist_ok=True)
+        for i in range(count):
+            with open(os.path.join(root, sub, pattern.format(i)), "wb") as f:
+                f.write(make())
+
+def bench_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="zip_folder.py bench",
+        description="除外判定と圧縮ポリシーを、これまでのやり方（fnmatch を1つずつ・すべて deflate）と比べます。"
+    )
+    parser.add_argument("folder", nargs="?", help="比べるフォルダ（省略するとテスト用のフォルダを作る）")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="圧縮に使うプロセス数")
+    parser.add_argument("--repeat", type=int, default=200, help="除外判定をくり返す回数")
+    args = parser.parse_args(argv)
+
+    work = tempfile.mkdtemp(prefix="zip_bench_")
+    try:
+        folder = args.folder
+        if not folder:
+            folder = os.path.join(work, "mixed")
+            make_mixed_tree(folder)
+
+        # 1) 除外判定: パターンごとの fnmatch と、まとめた正規表現
+        patterns = ["node_modules", "*.pyc", "dist", "build", "*.bak", "*.swp"] + DEFAULT_EXCLUDES
+        names = []
+        for _, dirs, files in os.walk(folder):
+            names.extend(dirs)
+            names.extend(files)
+        matcher = compile_excludes(patterns)
+        if [n for n in names if any(fnmatch(n, p) for p in patterns)] != \
+                [n for n in names if should_exclude(n, matcher)]:
+            raise RuntimeError("除外判定の結果が一致しません")
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            for n in names:
+                any(fnmatch(n, p) for p in patterns)
+        t1 = time.perf_counter()
+        for _ in range(args.repeat):
+            for n in names:
+                should_exclude(n, matcher)
+        t2 = time.perf_counter()
+        print(f"除外判定（{len(names)} 個の名前 × {args.repeat} 回, パターン {len(patterns)} 個）")
+        print(f"  fnmatch を1つずつ : {t1 - t0:.3f} 秒")
+        print(f"  まとめた正規表現 : {t2 - t1:.3f} 秒")
+
+        # 2) 圧縮: すべて deflate と、圧縮ポリシーあり
+        print(f"\n圧縮（jobs={args.jobs}）")
+        for label, policy in [("すべて deflate", CompressionPolicy(adaptive=False)),
+                              ("ポリシーあり", CompressionPolicy())]:
+            started = time.perf_counter()
+            zip_path = zip_directory(folder, out_name=label.replace(" ", "_"), quiet=True,
+                                     jobs=args.jobs, policy=policy, out_dir=work)
+            elapsed = time.perf_counter() - started
+            size_mb = os.path.getsize(zip_path) / (1024 * 1024)
+            stored = sum(policy.stats.values())
+            print(f"  {label}: {elapsed:.2f} 秒, {size_mb:.2f} MB（無圧縮 {stored} ファイル）")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+def restore_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="zip_folder.py restore",
+        description="差分ZIPと、その元になったZIPたちからフォルダを復元します。"
+    )
+    parser.add_argument("archive", help="復元したい時点のZIP（差分でもOK）")
+    parser.add_argument("dest", help="復元先フォルダ")
+    parser.add_argument("-q", "--quiet", action="store_true", help="進行状況を表示しない")
+    args = parser.parse_args(argv)
+    restore_archive(args.archive, args.dest, quiet=args.quiet)
+
 def main():
     try:
+        if len(sys.argv) > 1 and sys.argv[1] == "restore":
+            restore_main(sys.argv[2:])
+            return
+        if len(sys.argv) > 1 and sys.argv[1] == "bench":
+            bench_main(sys.argv[2:])
+            return
         args = parse_args()
-        zip_directory(args.folder, out_name=args.output, exclude_patterns=args.exclude, quiet=args.quiet)
+        policy = CompressionPolicy(args.level, adaptive=not args.no_adaptive)
+        options = dict(out_name=args.output, exclude_patterns=args.exclude, quiet=args.quiet,
+                       jobs=args.jobs, incremental=args.incremental, policy=policy)
+        if args.stdout:
+            if sys.stdout.isatty():
+                raise ValueError("端末には ZIP を出力できません。パイプかリダイレクトで受け取ってください")
+            zip_directory(args.folder, stream=sys.stdout.buffer, **options)
+        elif args.send:
+            sock, stream = open_socket_stream(args.send)
+            with sock, stream:
+                zip_directory(args.folder, stream=stream, **options)
+        else:
+            zip_directory(args.folder, **options)
     except Exception as e:
-        print(f"❌ エラー: {e}")
+        # --stdout のときに ZIP のデータへまざらないよう、エラーは標準エラーへ
+        print(f"❌ エラー: {e}", file=sys.stderr)
         sys.exit(1)
 
 if __name__ == "__main__":